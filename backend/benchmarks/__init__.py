@@ -0,0 +1,51 @@
+"""
+Benchmarks of the performance work, run from the backend directory
+against the configured database, e.g.
+`python -m benchmarks.ingredient_search`.
+"""
+
+import os
+from statistics import median
+from time import perf_counter
+from typing import Callable, List
+
+import django
+
+
+def setup() -> None:
+    """
+    Configure Django for a benchmark run outside `manage.py`.
+    """
+
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE", "foodgram_backend.settings"
+    )
+    django.setup()
+
+
+def timings(function: Callable[[], object], repeat: int) -> List[float]:
+    """
+    Call a function repeatedly and time every call.
+
+    Args:
+        function (Callable[[], object]): The code to time.
+        repeat (int): The number of calls.
+
+    Returns:
+        List[float]: The durations in seconds.
+    """
+
+    durations = []
+    for _ in range(repeat):
+        started = perf_counter()
+        function()
+        durations.append(perf_counter() - started)
+    return durations
+
+
+def median_ms(durations: List[float]) -> float:
+    """
+    Return the median of durations, in milliseconds.
+    """
+
+    return median(durations) * 1000
@@ -0,0 +1,55 @@
+"""
+Measure the throughput of anonymous recipe list requests through the
+full middleware stack, with the configured cache backend and with the
+dummy backend, which caches nothing (user-010).
+
+    python -m benchmarks.anonymous_cache [--requests 300]
+
+Set CACHE_BACKEND and CACHE_LOCATION to benchmark another backend, e.g.
+django.core.cache.backends.filebased.FileBasedCache and a directory.
+"""
+
+import argparse
+from time import perf_counter
+
+from benchmarks import setup
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    options = parser.parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment
+
+    from recipes.models import Tag
+
+    setup_test_environment()
+    slugs = list(Tag.objects.order_by("pk").values_list("slug", flat=True))
+    paths = ["/api/recipes/", "/api/recipes/?page=2", "/api/recipes/?limit=6"]
+    paths += [f"/api/recipes/?tags={slug}" for slug in slugs[:1]]
+    paths += ["/api/recipes/?" + "&".join(f"tags={slug}" for slug in slugs)]
+    client = Client()
+
+    def run(label: str) -> None:
+        hits = 0
+        started = perf_counter()
+        for number in range(options.requests):
+            response = client.get(paths[number % len(paths)])
+            assert response.status_code == 200, response.content
+            hits += response.get("X-Cache") == "HIT"
+        rate = options.requests / (perf_counter() - started)
+        print(f"{label}: {rate:.0f} req/s, {hits} hits")
+
+    run(settings.CACHES["default"]["BACKEND"].rsplit(".", 1)[-1])
+    with override_settings(CACHES={"default": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+    }}):
+        run("DummyCache (uncached)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Measure the time and peak memory of creating a recipe with a large
+JPEG sent as a multipart file or as base64 JSON (user-012).
+
+Every request runs in a fresh process, as if served by a freshly
+started worker, and in a transaction that is rolled back, with media
+written to a temporary directory. The request body is built before
+the peak RSS is reset, so the reported increase over the resident set
+is that of handling the request. Resetting the peak needs Linux.
+
+    python -m benchmarks.image_upload [--width 4000 --height 3000]
+        [--runs 3] [--skip-derivatives]
+"""
+
+import argparse
+import base64
+import multiprocessing
+import tempfile
+from io import BytesIO
+from time import perf_counter
+from typing import Tuple
+
+from PIL import Image
+
+from benchmarks import setup
+
+
+def jpeg(width: int, height: int) -> bytes:
+    """
+    Encode a noisy photo-sized JPEG, which compresses like a photo.
+    """
+
+    channels = [
+        Image.effect_noise((width, height), 60) for _ in range(3)
+    ]
+    output = BytesIO()
+    Image.merge("RGB", channels).save(output, "JPEG", quality=95)
+    return output.getvalue()
+
+
+def memory(field: str) -> int:
+    """
+    Read a memory figure of the current process.
+
+    Args:
+        field (str): The field of /proc/self/status, such as VmRSS.
+
+    Returns:
+        int: The value in KiB.
+    """
+
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    raise LookupError(field)
+
+
+def reset_peak() -> None:
+    """
+    Reset the peak resident set size (VmHWM) to the current one.
+    """
+
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def upload(
+    mode: str, image: bytes, media_root: str, derivatives: bool
+) -> Tuple[int, float, int]:
+    """
+    Create a recipe through the full request handler.
+
+    Returns:
+        Tuple[int, float, int]: The status code, the duration in seconds
+            and the peak RSS increase in KiB.
+    """
+
+    setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.db import transaction
+    from django.db.models.signals import post_save
+    from django.test import RequestFactory, override_settings
+    from django.test.client import ClientHandler
+    from rest_framework.authtoken.models import Token
+
+    from recipes.models import Ingredient, Recipe, Tag
+    from recipes.signals import create_image_derivatives
+
+    if not derivatives:
+        post_save.disconnect(create_image_derivatives, sender=Recipe)
+    with override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+        user = get_user_model().objects.create_user(
+            email="benchmark@example.com", username="benchmark",
+            first_name="Benchmark", last_name="Benchmark",
+            password="password-123",
+        )
+        token = Token.objects.create(user=user)
+        tag = Tag.objects.create(
+            name="benchmark", color="#000001", slug="benchmark"
+        )
+        ingredient = Ingredient.objects.create(
+            name="benchmark", measurement_unit="g"
+        )
+        fields = {"name": "Benchmark", "text": "Text", "cooking_time": 10}
+        headers = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+        factory = RequestFactory()
+        if mode == "multipart":
+            request = factory.post("/api/recipes/", {
+                **fields,
+                "tags": [tag.pk],
+                "ingredients[0]id": ingredient.pk,
+                "ingredients[0]amount": 10,
+                "image": SimpleUploadedFile(
+                    "photo.jpg", image, content_type="image/jpeg"
+                ),
+            }, **headers)
+        else:
+            request = factory.post("/api/recipes/", {
+                **fields,
+                "tags": [tag.pk],
+                "ingredients": [{"id": ingredient.pk, "amount": 10}],
+                "image": "data:image/jpeg;base64,"
+                + base64.b64encode(image).decode(),
+            }, content_type="application/json", **headers)
+        handler = ClientHandler(enforce_csrf_checks=False)
+        reset_peak()
+        baseline = memory("VmRSS")
+        started = perf_counter()
+        response = handler(request.environ)
+        duration = perf_counter() - started
+        peak = memory("VmHWM")
+        transaction.set_rollback(True)
+    return response.status_code, duration, peak - baseline
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-derivatives", action="store_true")
+    options = parser.parse_args()
+
+    image = jpeg(options.width, options.height)
+    print(
+        f"{options.width}x{options.height} JPEG, "
+        f"{len(image) / 2 ** 20:.1f} MiB"
+    )
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as media_root, context.Pool(
+        1, maxtasksperchild=1
+    ) as pool:
+        for mode in ("json", "multipart"):
+            for _ in range(options.runs):
+                status, duration, rss = pool.apply(upload, (
+                    mode, image, media_root, not options.skip_derivatives
+                ))
+                print(
+                    f"{mode:>9}: {status} in {duration * 1000:.0f} ms, "
+                    f"peak RSS +{rss / 1024:.0f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
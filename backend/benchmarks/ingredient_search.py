@@ -0,0 +1,62 @@
+"""
+Compare ingredient autocomplete served by the in-memory
+`ingredient_index` with the `IngredientSearchFilter` query it replaced,
+over prefixes of the catalogue names (user-003).
+
+    python -m benchmarks.ingredient_search [--queries 200] [--repeat 5]
+"""
+
+import argparse
+import random
+
+from benchmarks import median_ms, setup, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    options = parser.parse_args()
+    setup()
+
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from foodgram_api.filters import IngredientSearchFilter
+    from foodgram_api.search import ingredient_index
+    from foodgram_api.serializers import IngredientSerializer
+    from foodgram_api.views import IngredientsViewSet
+    from recipes.models import Ingredient
+
+    names = list(Ingredient.objects.values_list("name", flat=True))
+    if not names:
+        parser.error("the catalogue is empty, run import_catalogue first")
+    generator = random.Random(options.seed)
+    queries = [
+        name[:generator.randint(1, 4)]
+        for name in generator.choices(names, k=options.queries)
+    ]
+    factory = APIRequestFactory()
+    view = IngredientsViewSet()
+
+    def filtered(query: str) -> list:
+        request = Request(factory.get("/api/ingredients/", {"name": query}))
+        queryset = IngredientSearchFilter().filter_queryset(
+            request, Ingredient.objects.all(), view
+        )
+        return IngredientSerializer(queryset, many=True).data
+
+    ingredient_index.search(queries[0])
+    print(f"{len(names)} ingredients, {len(queries)} queries")
+    for label, search in (
+        ("index", ingredient_index.search), ("filter", filtered)
+    ):
+        durations = []
+        for query in queries:
+            durations += timings(lambda: search(query), options.repeat)
+        print(f"{label:>6}: {median_ms(durations):.3f} ms per query (p50)")
+
+
+if __name__ == "__main__":
+    main()
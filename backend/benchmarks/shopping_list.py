@@ -0,0 +1,102 @@
+"""
+Measure the peak traced memory and the time of rendering shopping lists
+of synthetic rows with the streaming renderers, next to the in-memory
+openpyxl workbook they replaced (user-005).
+
+    python -m benchmarks.shopping_list [--lines 10 1000 50000]
+"""
+
+import argparse
+import tracemalloc
+from io import BytesIO
+from time import perf_counter
+from typing import Callable, Iterable, List, Tuple
+
+import openpyxl
+
+from benchmarks import setup
+
+Row = Tuple[str, str, int]
+
+
+def rows(count: int) -> List[Row]:
+    """
+    Build `count` shopping list rows with realistic name lengths.
+    """
+
+    return [
+        (f"Ingredient number {number} with a longer name", "g", number)
+        for number in range(count)
+    ]
+
+
+def openpyxl_workbook(lines: Iterable[Row]) -> bytes:
+    """
+    Render a shopping list the way the download did before streaming.
+    """
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Shopping List"
+    sheet.append(["Ingredient", "Measurement Unit", "Total Amount"])
+    for line in lines:
+        sheet.append(list(line))
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def measure(render: Callable[[], object]) -> Tuple[int, float]:
+    """
+    Run a render, returning its peak traced memory in bytes and its
+    duration in seconds.
+    """
+
+    tracemalloc.start()
+    started = perf_counter()
+    render()
+    duration = perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[10, 1000, 50000]
+    )
+    options = parser.parse_args()
+    setup()
+
+    from foodgram_api.renderers import (ShoppingListCSVRenderer,
+                                        ShoppingListJSONRenderer,
+                                        ShoppingListTextRenderer,
+                                        ShoppingListXLSXRenderer)
+
+    def streamed(renderer) -> Callable[[Iterable[Row]], int]:
+        def render(lines: Iterable[Row]) -> int:
+            return sum(len(chunk) for chunk in renderer().stream(lines))
+        return render
+
+    renderers = {
+        "openpyxl": openpyxl_workbook,
+        "xlsx": streamed(ShoppingListXLSXRenderer),
+        "csv": streamed(ShoppingListCSVRenderer),
+        "txt": streamed(ShoppingListTextRenderer),
+        "json": streamed(ShoppingListJSONRenderer),
+    }
+    print("lines:    " + " | ".join(f"{count:>18}" for count in options.lines))
+    for label, render in renderers.items():
+        results = []
+        for count in options.lines:
+            lines = rows(count)
+            peak, duration = measure(lambda: render(iter(lines)))
+            results.append(
+                f"{peak / 1024:>8.0f} KiB {duration * 1000:>6.0f} ms"
+            )
+        print(f"{label:<9} " + " | ".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from typing import Any, Dict, Iterator, Optional
+
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
+from django.forms import Media
+from django.http import HttpRequest
+
+from foodgram_api.pagination import ESTIMATED, CountingPaginator
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    List filter choosing one related object with an autocomplete box.
+
+    The default filter of a foreign key renders a link for every related
+    row; this one only loads the selected row and searches the others
+    through the admin autocomplete view, so the admin of the related
+    model must define `search_fields`. Use `for_field` to build one.
+
+    Attributes:
+        field_name (str): The foreign key to filter on.
+    """
+
+    template = "admin/autocomplete_filter.html"
+    field_name: str
+
+    @classmethod
+    def for_field(cls, field_name: str) -> type:
+        """
+        Build a filter class for a foreign key.
+
+        Args:
+            field_name (str): The foreign key to filter on.
+
+        Returns:
+            type: The filter class.
+        """
+
+        return type(
+            f"{field_name.title()}AutocompleteFilter",
+            (cls,),
+            {"field_name": field_name, "parameter_name": field_name},
+        )
+
+    def __init__(
+        self, request: HttpRequest, params: Dict[str, str],
+        model: type, model_admin: admin.ModelAdmin
+    ) -> None:
+        self.field = model._meta.get_field(self.field_name)
+        self.title = self.field.verbose_name
+        super().__init__(request, params, model, model_admin)
+
+    def has_output(self) -> bool:
+        return True
+
+    def lookups(self, request: HttpRequest, model_admin: admin.ModelAdmin):
+        return ()
+
+    def queryset(
+        self, request: HttpRequest, queryset: QuerySet
+    ) -> Optional[QuerySet]:
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{self.field.attname: self.value()})
+        except (ValueError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+    def choices(self, changelist: ChangeList) -> Iterator[Dict[str, Any]]:
+        form_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(
+                self.field, changelist.model_admin.admin_site
+            ),
+        )
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(
+                remove=[self.parameter_name]
+            ),
+            "hidden_params": [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+            "widget": form_field.widget.render(
+                self.parameter_name,
+                self.value(),
+                {"id": f"autocomplete-filter-{self.parameter_name}"},
+            ),
+        }
+
+
+class LargeTableAdminMixin:
+    """
+    Keeps the changelist of a large table within a fixed query budget.
+
+    The result count is the planner's estimate on large tables (see
+    `CountingPaginator`), the unfiltered total is not counted, and the
+    assets of `AutocompleteFilter` are added to the page media.
+    """
+
+    show_full_result_count = False
+
+    def get_paginator(
+        self, request: HttpRequest, queryset: QuerySet, per_page: int,
+        orphans: int = 0, allow_empty_first_page: bool = True
+    ) -> CountingPaginator:
+        return CountingPaginator(queryset, per_page, strategy=ESTIMATED)
+
+    @property
+    def media(self) -> Media:
+        media = super().media
+        if any(
+            isinstance(list_filter, type)
+            and issubclass(list_filter, AutocompleteFilter)
+            for list_filter in self.list_filter
+        ):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
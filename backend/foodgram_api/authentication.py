@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from copy import copy
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+from typing import Any, NamedTuple, Optional, Tuple
+
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram_api.caching import get_version
+
+
+def token_version_name(key: str) -> str:
+    """
+    Name the data set whose version guards a cached token.
+
+    The key is hashed so that tokens never appear in the cache.
+
+    Args:
+        key (str): The token key.
+
+    Returns:
+        str: The data set name, see `foodgram_api.caching`.
+    """
+
+    return f"auth:{sha256(key.encode()).hexdigest()[:32]}"
+
+
+class CachedToken(NamedTuple):
+    """
+    A token and its user, as loaded from the database.
+    """
+
+    user: Any
+    token: Any
+    version: int
+    cached_at: float
+
+
+class TokenUserCache:
+    """
+    Per-worker LRU cache mapping token keys to their users.
+
+    An entry is used only while the version of its token (see
+    `token_version_name`) is unchanged and it is younger than `ttl`.
+    Versions are bumped on logout, password change and any other save
+    of the user (see `foodgram_api.signals`). With a shared cache
+    backend every worker sees them; with a process-local one, such as
+    the default local-memory cache, only the worker that made the
+    change does. The TTL bounds staleness in the other workers and after
+    writes that skip signals, such as `QuerySet.update()`.
+
+    Attributes:
+        maxsize (int): The largest number of cached tokens.
+        ttl (int): Maximum age of an entry in seconds.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that went to the database.
+    """
+
+    maxsize = 10000
+    ttl = 60
+
+    def __init__(self) -> None:
+        self._entries: "OrderedDict[str, CachedToken]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[Any, Any]]:
+        """
+        Return the user and token cached for a key, if still valid.
+
+        The returned objects are copies, so requests never share them.
+
+        Args:
+            key (str): The token key.
+
+        Returns:
+            Optional[Tuple[Any, Any]]: The user and the token.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if (
+            entry is None
+            or monotonic() - entry.cached_at >= self.ttl
+            or get_version(token_version_name(key)) != entry.version
+        ):
+            if entry is not None:
+                with self._lock:
+                    self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        user, token = copy(entry.user), copy(entry.token)
+        token.user = user
+        return user, token
+
+    def set(self, key: str, user: Any, token: Any, version: int) -> None:
+        """
+        Cache copies of the user and token of a key, so that changes
+        made to them while serving a request are not cached.
+
+        Args:
+            key (str): The token key.
+            user: The token's user.
+            token: The token.
+            version (int): The version of the token read before it was
+                loaded from the database.
+        """
+
+        entry = CachedToken(copy(user), copy(token), version, monotonic())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all entries and reset the statistics.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+token_users = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication serving repeated tokens from `token_users`.
+
+    Only tokens of active users are cached; invalid tokens always go to
+    the database and fail there. A logout seen by one worker only reaches
+    the others within `TokenUserCache.ttl` when the cache backend is
+    process-local.
+    """
+
+    def authenticate_credentials(self, key: str) -> Tuple[Any, Any]:
+        cached = token_users.get(key)
+        if cached is not None:
+            return cached
+        version = get_version(token_version_name(key))
+        user, token = super().authenticate_credentials(key)
+        token_users.set(key, user, token, version)
+        return user, token
@@ -0,0 +1,408 @@
+import gzip
+import re
+from hashlib import md5, sha256
+from time import monotonic, time_ns
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpRequest, HttpResponse
+from django.utils.http import parse_etags
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+CATALOGUE = "catalogue"
+RECIPES = "recipes"
+
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
+
+def recipe_version_name(pk: Any) -> str:
+    """
+    Name the data set of one recipe, its tags and ingredients.
+    """
+
+    return f"recipe:{pk}"
+
+
+def author_version_name(pk: Any) -> str:
+    """
+    Name the data set of an author's profile and recipes.
+    """
+
+    return f"author:{pk}"
+
+
+def tag_version_name(slug: str) -> str:
+    """
+    Name the data set of the recipes carrying a tag.
+    """
+
+    return f"tag:{slug}"
+
+
+def cache_is_shared() -> bool:
+    """
+    Check whether the default cache is shared by all processes.
+
+    Version bumps and counters written by one worker or management
+    command are only seen by the others through a shared cache. With a
+    process-local one each worker caches for itself, and the caches
+    invalidated by versions bound their staleness with a timeout.
+
+    Returns:
+        bool: False for the local-memory and dummy backends.
+    """
+
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def version_key(name: str) -> str:
+    """
+    Build the cache key holding the version of a named data set.
+
+    Args:
+        name (str): The data set name, e.g. a database table.
+
+    Returns:
+        str: The cache key.
+    """
+
+    return f"version:{name}"
+
+
+def get_versions(names: Iterable[str]) -> List[int]:
+    """
+    Read the current versions of several data sets.
+
+    Versions missing from the cache (never bumped or evicted) are
+    initialized with the current time, so that a lost counter never
+    falls back to a value that earlier cache entries were stored under.
+
+    Args:
+        names (Iterable[str]): The data set names.
+
+    Returns:
+        List[int]: The versions, in the order of `names`.
+    """
+
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(name: str) -> int:
+    """
+    Read the current version of a data set.
+
+    Args:
+        name (str): The data set name.
+
+    Returns:
+        int: The version.
+    """
+
+    return get_versions([name])[0]
+
+
+def increment(key: str) -> None:
+    """
+    Increment a counter kept in the cache, creating it if needed.
+
+    Args:
+        key (str): The cache key of the counter.
+    """
+
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def bump_version(name: str) -> None:
+    """
+    Move a data set to a new version, orphaning entries cached for it.
+
+    Args:
+        name (str): The data set name.
+    """
+
+    try:
+        cache.incr(version_key(name))
+    except ValueError:
+        cache.set(version_key(name), time_ns(), timeout=None)
+
+
+class PreparedResponse(NamedTuple):
+    """
+    A serialized response body with its compressed form and ETags.
+    """
+
+    version: int
+    built_at: float
+    digest: str
+    body: bytes
+    gzipped: bytes
+
+    def respond(
+        self, request: HttpRequest, content_type: str = "application/json"
+    ) -> HttpResponse:
+        """
+        Answer a request with the prepared body.
+
+        Clients accepting gzip get the compressed bytes. A matching
+        `If-None-Match` is answered with `304 Not Modified`. Each encoding
+        has its own strong ETag, derived from the content.
+
+        Args:
+            request (HttpRequest): The incoming request.
+            content_type (str): The media type of the body.
+
+        Returns:
+            HttpResponse: The response.
+        """
+
+        use_gzip = bool(
+            ACCEPTS_GZIP.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        )
+        etag = f'"{self.digest}-gzip"' if use_gzip else f'"{self.digest}"'
+        if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(
+                self.gzipped if use_gzip else self.body,
+                content_type=content_type,
+            )
+            if use_gzip:
+                response["Content-Encoding"] = "gzip"
+            response["Content-Length"] = len(response.content)
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+
+class PreparedResponseCache:
+    """
+    Per-worker store of serialized response bodies.
+
+    An entry is rebuilt when the version of its data set changes, or once
+    it is older than `ttl`, which bounds staleness when the cache backend
+    is per process and other workers' version bumps are not seen.
+
+    Attributes:
+        ttl (int): Maximum age of an entry in seconds.
+    """
+
+    ttl = 300
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, PreparedResponse] = {}
+
+    def get(
+        self, key: str, version: int, build: Callable[[], bytes]
+    ) -> PreparedResponse:
+        """
+        Return the prepared body for a key, building it when needed.
+
+        Args:
+            key (str): The response key.
+            version (int): The current version of the data set.
+            build (Callable[[], bytes]): Serializes the response body.
+
+        Returns:
+            PreparedResponse: The prepared body.
+        """
+
+        entry = self._entries.get(key)
+        if (
+            entry is None
+            or entry.version != version
+            or monotonic() - entry.built_at >= self.ttl
+        ):
+            body = build()
+            entry = PreparedResponse(
+                version,
+                monotonic(),
+                sha256(body).hexdigest()[:32],
+                body,
+                gzip.compress(body, mtime=0),
+            )
+            self._entries[key] = entry
+        return entry
+
+
+prepared_responses = PreparedResponseCache()
+
+
+class PreparedListMixin:
+    """
+    Serves the unfiltered JSON list of a view from `prepared_responses`.
+
+    Requests with query parameters or a non-JSON renderer fall back to
+    the regular `list()`. With a process-local cache backend a worker
+    does not see the version bumps of the others, and
+    `PreparedResponseCache.ttl` bounds how long their writes go unseen.
+
+    Attributes:
+        prepared_version (str): The data set whose version keys the list.
+    """
+
+    prepared_version = CATALOGUE
+
+    def list(self, request: Request, *args, **kwargs) -> Any:
+        if request.query_params or request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        entry = prepared_responses.get(
+            f"{self.basename}-list",
+            get_version(self.prepared_version),
+            lambda: request.accepted_renderer.render(
+                self.get_serializer(
+                    self.filter_queryset(self.get_queryset()), many=True
+                ).data
+            ),
+        )
+        return entry.respond(request)
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Caches the `list` and `retrieve` responses served to anonymous users.
+
+    Response data is stored in the default cache under a key built from
+    the path, the normalized query string and the versions returned by
+    `get_anonymous_cache_versions()`, so entries are dropped as soon as
+    one of these versions is bumped. Works with any Django cache backend.
+    With a process-local one, such as the default local-memory cache,
+    every worker keeps its own entries and only sees its own version
+    bumps, so `anonymous_cache_timeout` bounds how long a write made by
+    another worker can go unseen. Hits and misses are counted in the
+    cache, where a shared backend lets every worker and the
+    `recipe_cache_stats` command see them (see `anonymous_cache_stats()`),
+    and reported in the `X-Cache` header.
+
+    Attributes:
+        anonymous_cache_versions (tuple):
+            Data sets the responses depend on, unless a view narrows them
+            per request.
+        anonymous_cache_ignored_params (tuple):
+            Query parameters that have no effect for anonymous users.
+        anonymous_cache_timeout (int): Lifetime of an entry in seconds,
+            the longest staleness with a process-local cache.
+    """
+
+    anonymous_cache_versions = (RECIPES, CATALOGUE)
+    anonymous_cache_ignored_params = ("is_favorited", "is_in_shopping_cart")
+    anonymous_cache_timeout = 600
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return self.get_cached_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        return self.get_cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def get_anonymous_cache_versions(
+        self, request: Request
+    ) -> Iterable[str]:
+        """
+        Name the data sets the response to a request depends on.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            Iterable[str]: The data set names.
+        """
+
+        return self.anonymous_cache_versions
+
+    def get_anonymous_cache_key(self, request: Request) -> str:
+        """
+        Build the cache key of a request.
+
+        Repeated and reordered query parameters map to the same key.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            str: The cache key.
+        """
+
+        query = sorted(
+            (name, tuple(sorted(set(request.query_params.getlist(name)))))
+            for name in request.query_params
+            if name not in self.anonymous_cache_ignored_params
+        )
+        versions = "-".join(
+            str(version)
+            for version in get_versions(
+                self.get_anonymous_cache_versions(request)
+            )
+        )
+        digest = md5(
+            repr((request.scheme, request.get_host(), request.path, query))
+            .encode()
+        ).hexdigest()
+        return f"response:{self.basename}:{digest}:{versions}"
+
+    def get_cached_response(
+        self, request: Request, handler: Callable[..., Response],
+        *args, **kwargs
+    ) -> Response:
+        """
+        Answer an anonymous request from the cache or cache its response.
+
+        Args:
+            request (Request): The incoming request.
+            handler (Callable[..., Response]): The uncached view method.
+
+        Returns:
+            Response: The response.
+        """
+
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_anonymous_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            increment(f"{self.basename}:anonymous-cache:hits")
+            return Response(data, headers={"X-Cache": "HIT"})
+        increment(f"{self.basename}:anonymous-cache:misses")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.anonymous_cache_timeout)
+        response["X-Cache"] = "MISS"
+        return response
+
+
+def anonymous_cache_stats(basename: str) -> Tuple[int, int]:
+    """
+    Read the hit and miss counters of an anonymous response cache.
+
+    Args:
+        basename (str): The basename of the cached viewset.
+
+    Returns:
+        Tuple[int, int]: The number of hits and misses.
+    """
+
+    counters = cache.get_many([
+        f"{basename}:anonymous-cache:hits",
+        f"{basename}:anonymous-cache:misses",
+    ])
+    return (
+        counters.get(f"{basename}:anonymous-cache:hits", 0),
+        counters.get(f"{basename}:anonymous-cache:misses", 0),
+    )
@@ -0,0 +1,119 @@
+from typing import Any, List, NamedTuple, Type
+
+from django.contrib.auth import get_user_model
+from django.db import connection, models
+from django.db.models import F
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+EXPECTED_COUNTS = """
+    SELECT holder.id, COUNT(counted.{foreign_key}) AS total
+    FROM {holder} AS holder
+    LEFT JOIN {counted} AS counted ON counted.{foreign_key} = holder.id
+    GROUP BY holder.id
+"""
+
+COUNT_DRIFT = """
+    SELECT COUNT(*)
+    FROM {holder} AS holder
+    JOIN ({expected}) AS expected ON expected.id = holder.id
+    WHERE holder.{field} <> expected.total
+"""
+
+FIX_DRIFT = """
+    UPDATE {holder} AS holder SET {field} = expected.total
+    FROM ({expected}) AS expected
+    WHERE expected.id = holder.id AND holder.{field} <> expected.total
+"""
+
+
+class Counter(NamedTuple):
+    """
+    A count of related rows stored on the row they point to.
+
+    Attributes:
+        holder (Type[models.Model]): The model storing the count.
+        field (str): The counter field of `holder`.
+        counted (Type[models.Model]): The model whose rows are counted.
+        foreign_key (str): The field of `counted` pointing to `holder`.
+    """
+
+    holder: Type[models.Model]
+    field: str
+    counted: Type[models.Model]
+    foreign_key: str
+
+    def change(
+        self, instance: models.Model, delta: int, origin: Any = None
+    ) -> None:
+        """
+        Add `delta` to the counter of the row a counted row points to.
+
+        Nothing is updated when the deletion of the counted row was
+        caused by deleting that very holder row.
+
+        Args:
+            instance (models.Model): The created or deleted counted row.
+            delta (int): 1 for a created row, -1 for a deleted one.
+            origin: The instance or queryset a deletion started from.
+        """
+
+        holder_id = getattr(instance, f"{self.foreign_key}_id")
+        if isinstance(origin, self.holder) and origin.pk == holder_id:
+            return
+        self.holder.objects.filter(pk=holder_id).update(
+            **{self.field: F(self.field) + delta}
+        )
+
+    def reconcile(self, dry_run: bool = False) -> int:
+        """
+        Recount the counter of every holder row and fix the wrong ones.
+
+        Args:
+            dry_run (bool): Only count the wrong rows.
+
+        Returns:
+            int: The number of rows whose counter was wrong.
+        """
+
+        quote = connection.ops.quote_name
+        tables = {
+            "holder": quote(self.holder._meta.db_table),
+            "counted": quote(self.counted._meta.db_table),
+            "foreign_key": quote(
+                self.counted._meta.get_field(self.foreign_key).column
+            ),
+            "field": quote(self.field),
+        }
+        tables["expected"] = EXPECTED_COUNTS.format(**tables)
+        with connection.cursor() as cursor:
+            if dry_run:
+                cursor.execute(COUNT_DRIFT.format(**tables))
+                return cursor.fetchone()[0]
+            cursor.execute(FIX_DRIFT.format(**tables))
+            return cursor.rowcount
+
+
+COUNTERS = (
+    Counter(Recipe, "favorites_count", Favorite, "recipe"),
+    Counter(Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    Counter(User, "recipes_count", Recipe, "author"),
+    Counter(User, "followers_count", Subscription, "author"),
+)
+
+
+def counters_of(model: Type[models.Model]) -> List[Counter]:
+    """
+    List the counters that count rows of a model.
+
+    Args:
+        model (Type[models.Model]): The counted model.
+
+    Returns:
+        List[Counter]: The counters.
+    """
+
+    return [counter for counter in COUNTERS if counter.counted is model]
@@ -0,0 +1,114 @@
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from django import forms
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from recipes.images import DERIVATIVE_SIZES
+from recipes.models import Recipe
+
+
+class RecipeImagesField(serializers.ReadOnlyField):
+    """
+    Read-only map of the recipe image URLs by size, for `srcset`.
+
+    Sizes whose WebP derivative has not been generated yet point to the
+    original image.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        kwargs["source"] = "*"
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe: Recipe) -> Dict[str, str]:
+        if not recipe.image:
+            return {}
+        request = self.context.get("request")
+        derivatives = recipe.image_derivatives or {}
+        urls = {}
+        for size in DERIVATIVE_SIZES:
+            name = derivatives.get(size)
+            url = default_storage.url(name) if name else recipe.image.url
+            urls[size] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class LimitedDjangoImageField(forms.ImageField):
+    """
+    Django image form field rejecting images with too many pixels.
+
+    The dimensions come from the image header read during validation,
+    so oversized images are rejected before their pixels are decoded.
+
+    Attributes:
+        max_pixels (int): The largest accepted width times height.
+    """
+
+    max_pixels = 40_000_000
+
+    def to_python(self, data: Any) -> Optional[UploadedFile]:
+        file = super().to_python(data)
+        if file is not None:
+            width, height = file.image.size
+            if width * height > self.max_pixels:
+                raise DjangoValidationError(
+                    f"The image is too large: {width}x{height} pixels, "
+                    f"at most {self.max_pixels} pixels are allowed.",
+                    code="max_pixels",
+                )
+        return file
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Image field accepting a base64 string or a multipart file upload.
+
+    The byte size is checked before anything is decoded: uploaded files
+    by their size, base64 strings by their length. Pixel dimensions are
+    checked from the image header, see `LimitedDjangoImageField`.
+    Uploaded files are renamed to a random name like base64 images.
+
+    Attributes:
+        max_bytes (int): The largest accepted image size in bytes.
+    """
+
+    max_bytes = 20 * 1024 * 1024
+
+    def __init__(self, **kwargs) -> None:
+        kwargs.setdefault("_DjangoImageField", LimitedDjangoImageField)
+        super().__init__(**kwargs)
+
+    def check_size(self, size: int) -> None:
+        """
+        Reject images larger than `max_bytes`.
+
+        Args:
+            size (int): The size of the image in bytes.
+
+        Raises:
+            serializers.ValidationError: If the image is too large.
+        """
+
+        if size > self.max_bytes:
+            raise serializers.ValidationError(
+                f"The image is too large: at most {self.max_bytes} bytes "
+                "are allowed."
+            )
+
+    def to_internal_value(self, data: Any) -> Any:
+        if isinstance(data, UploadedFile):
+            self.check_size(data.size)
+            file = serializers.ImageField.to_internal_value(self, data)
+            extension = file.image.format.lower()
+            file.name = (
+                f"{uuid4()}.{'jpg' if extension == 'jpeg' else extension}"
+            )
+            return file
+        if isinstance(data, str):
+            encoded = data.partition(";base64,")[2] or data
+            self.check_size(len(encoded) * 3 // 4)
+        return super().to_internal_value(data)
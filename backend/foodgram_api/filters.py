@@ -1,9 +1,12 @@
+from typing import Dict, List, Tuple
+
 from django.contrib.auth import get_user_model
 from django.db.models import QuerySet
+from django.utils.functional import cached_property
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from recipes.models import Recipe, Tag
 
 
 User = get_user_model()
@@ -20,27 +23,120 @@ class IngredientSearchFilter(SearchFilter):
 class RecipesFilter(FilterSet):
     """
     Custom filter set for filtering recipes.
-    Supports filtering by tags, is_favorited, and is_in_shopping_cart.
+    Supports filtering by tags, is_favorited, is_in_shopping_cart
+    and a ranked text search.
 
     Attributes:
-        tags (AllValuesMultipleFilter):
-            Filter to apply on tags using their slugs.
+        tags (MultipleChoiceFilter):
+            Filter to apply on tags using their slugs, matched against
+            the tag bitmask of the recipes.
+        tags_match (ChoiceFilter):
+            Whether recipes need "any" (the default) or "all"
+            of the tags.
         is_favorited (BooleanFilter):
             Filter to check if a recipe is favorited by the current user.
         is_in_shopping_cart (BooleanFilter):
             Filter to check if a recipe is
             in the shopping cart of the current user.
+        search (CharFilter):
+            Full-text and fuzzy search over the name, description
+            and ingredient names, ordering results by relevance.
     """
 
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.MultipleChoiceFilter(choices=(), method="filter_tags")
+    tags_match = filters.ChoiceFilter(
+        choices=(("any", "any"), ("all", "all")), method="filter_tags_match"
+    )
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = filters.CharFilter(method="filter_search")
 
     class Meta:
         model = Recipe
-        fields = ["tags", "author", "is_favorited", "is_in_shopping_cart"]
+        fields = [
+            "tags", "tags_match", "author", "is_favorited",
+            "is_in_shopping_cart", "search",
+        ]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # The form evaluates the choices as soon as it is built, so the
+        # tags are only read when the request filters by them.
+        if "tags" in self.data:
+            self.filters["tags"].extra["choices"] = self.tag_choices
+
+    @cached_property
+    def tag_bits(self) -> Dict[str, int]:
+        """
+        Map the tag slugs to their mask bits.
+
+        Read once per request from the database, so that the choices and
+        the mask always come from the same state of the tags.
+
+        Returns:
+            Dict[str, int]: The bit of every tag that has one.
+        """
+
+        return dict(Tag.objects.exclude(bit=None).values_list("slug", "bit"))
+
+    def tag_choices(self) -> List[Tuple[str, str]]:
+        """
+        List the tag slugs accepted by the tags filter.
+
+        Returns:
+            List[Tuple[str, str]]: The choices.
+        """
+
+        return [(slug, slug) for slug in sorted(self.tag_bits)]
+
+    def filter_tags(
+        self, queryset: QuerySet, name: str, value: List[str]
+    ) -> QuerySet:
+        """
+        Filter the queryset by tags through the recipe tag bitmask,
+        without joins or DISTINCT.
+
+        Args:
+            queryset (QuerySet): The initial queryset.
+            name (str): The name of the filter.
+            value (List[str]): The tag slugs.
+
+        Returns:
+            QuerySet: The filtered queryset.
+        """
+
+        if not value:
+            return queryset
+        bits = self.tag_bits
+        mask = 0
+        for slug in value:
+            mask |= 1 << bits[slug]
+        universe = 0
+        for bit in bits.values():
+            universe |= 1 << bit
+        return queryset.with_tags(
+            mask, universe,
+            match_all=self.form.cleaned_data.get("tags_match") == "all",
+        )
+
+    def filter_tags_match(
+        self, queryset: QuerySet, name: str, value: str
+    ) -> QuerySet:
+        """
+        Leave the queryset as is; the value is read by `filter_tags`.
+
+        Args:
+            queryset (QuerySet): The initial queryset.
+            name (str): The name of the filter.
+            value (str): "any" or "all".
+
+        Returns:
+            QuerySet: The queryset.
+        """
+
+        return queryset
 
     def filter_is_favorited(
         self, queryset: QuerySet, name: str, value: bool
@@ -79,3 +175,23 @@ class RecipesFilter(FilterSet):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(in_shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_search(
+        self, queryset: QuerySet, name: str, value: str
+    ) -> QuerySet:
+        """
+        Filter and rank the queryset by a text search.
+
+        Args:
+            queryset (QuerySet): The initial queryset.
+            name (str): The name of the filter.
+            value (str): The search text.
+
+        Returns:
+            QuerySet: The matching recipes, best matches first.
+        """
+
+        value = value.strip()
+        if value:
+            return queryset.search(value)
+        return queryset
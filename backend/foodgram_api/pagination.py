@@ -1,13 +1,33 @@
-from typing import Optional
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import md5
+from typing import Any, List, Optional, Tuple, Union
 
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Model, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from foodgram_api.caching import get_versions
+from recipes.models import TimelineEntry
 
-class CustomPageNumberPagination(PageNumberPagination):
+EXACT = "exact"
+CACHED = "cached"
+ESTIMATED = "estimated"
+
+
+class PageSizeMixin:
     """
-    Custom pagination class that extends PageNumberPagination.
-    Allows clients to control the page size using a query parameter.
+    Lets clients control the page size with the `limit` query parameter.
     """
 
     page_size = 6
@@ -40,3 +60,413 @@ class CustomPageNumberPagination(PageNumberPagination):
             except (KeyError, ValueError):
                 pass
         return self.page_size
+
+
+class EstimatedPage(Page):
+    """
+    Page of a paginator whose count is an estimate.
+
+    Whether a next page exists is known from fetching one extra row, as
+    the estimated number of pages may be off in either direction.
+    """
+
+    def __init__(
+        self, object_list: List[Any], number: int, paginator: Paginator,
+        has_more: bool
+    ) -> None:
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self) -> bool:
+        return self.has_more
+
+
+class CountingPaginator(Paginator):
+    """
+    Django paginator computing the total count with a chosen strategy.
+
+    - `exact` runs `COUNT(*)` on every request.
+    - `cached` caches the exact count for `cache_timeout` seconds under
+      a key that includes the versions of all tables in the query, so a
+      write to any of them (see `foodgram_api.signals`) invalidates it.
+      With a process-local cache a worker only sees its own writes, and
+      `cache_timeout` bounds how long the others' go unseen.
+    - `estimated` asks the PostgreSQL planner: `pg_class.reltuples` for
+      unfiltered querysets, the `EXPLAIN` row estimate otherwise. Below
+      `exact_threshold` rows the exact count is cheap and used instead.
+
+    Attributes:
+        count_strategy (str):
+            The strategy that produced `count`; an estimated paginator
+            reports `exact` when it fell back to counting.
+    """
+
+    def __init__(
+        self,
+        object_list: Union[QuerySet, List[Any]],
+        per_page: int,
+        strategy: str = EXACT,
+        exact_threshold: int = 10000,
+        cache_timeout: int = 60,
+    ) -> None:
+        super().__init__(object_list, per_page)
+        self.strategy = strategy
+        self.count_strategy = strategy
+        self.exact_threshold = exact_threshold
+        self.cache_timeout = cache_timeout
+
+    @cached_property
+    def count(self) -> int:
+        if not isinstance(self.object_list, QuerySet):
+            self.count_strategy = EXACT
+            return super().count
+        if self.strategy == CACHED:
+            return self.get_cached_count()
+        if self.strategy == ESTIMATED:
+            estimate = self.get_estimated_count()
+            if estimate is not None and estimate >= self.exact_threshold:
+                return estimate
+        self.count_strategy = EXACT
+        return super().count
+
+    def get_cached_count(self) -> int:
+        """
+        Return the exact count, computing it only on a cache miss.
+
+        Returns:
+            int: The number of rows in the queryset.
+        """
+
+        query = self.object_list.query
+        sql, params = query.get_compiler(self.object_list.db).as_sql()
+        tables = sorted(
+            {query.model._meta.db_table}
+            | {join.table_name for join in query.alias_map.values()}
+        )
+        key = "count:" + md5(
+            repr((sql, params, get_versions(tables))).encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, self.cache_timeout)
+        return count
+
+    def get_estimated_count(self) -> Optional[int]:
+        """
+        Return the planner's estimate of the number of rows.
+
+        Returns:
+            Optional[int]:
+                The estimate, or None when the database is not PostgreSQL.
+        """
+
+        connection = connections[self.object_list.db]
+        if connection.vendor != "postgresql":
+            return None
+        query = self.object_list.query
+        with connection.cursor() as cursor:
+            if not query.where and not query.distinct:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(query.model._meta.db_table)],
+                )
+                reltuples = cursor.fetchone()[0]
+                if reltuples >= 0:
+                    return int(reltuples)
+            sql, params = query.get_compiler(connection=connection).as_sql()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def validate_number(self, number: Any) -> int:
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_strategy != ESTIMATED or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number: Any) -> Page:
+        number = self.validate_number(number)
+        if self.count_strategy != ESTIMATED:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        return EstimatedPage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page
+        )
+
+
+class CustomPageNumberPagination(PageSizeMixin, PageNumberPagination):
+    """
+    Custom pagination class that extends PageNumberPagination.
+    Allows clients to control the page size using a query parameter.
+
+    The total count is computed with the view's `count_strategy` (see
+    `CountingPaginator`) and the strategy used is returned alongside it.
+
+    Attributes:
+        count_strategy (str): The default count strategy.
+        count_exact_threshold (int):
+            Estimates below this are replaced by exact counts.
+        count_cache_timeout (int): How long cached counts live, in seconds.
+    """
+
+    count_strategy = EXACT
+    count_exact_threshold = 10000
+    count_cache_timeout = 60
+
+    def django_paginator_class(
+        self, object_list: Union[QuerySet, List[Any]], per_page: int
+    ) -> CountingPaginator:
+        return CountingPaginator(
+            object_list,
+            per_page,
+            strategy=self.count_strategy,
+            exact_threshold=self.count_exact_threshold,
+            cache_timeout=self.count_cache_timeout,
+        )
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view: Any = None
+    ) -> Optional[List[Model]]:
+        self.count_strategy = getattr(
+            view, "count_strategy", self.count_strategy
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data: List[Any]) -> Response:
+        return Response({
+            "count": self.page.paginator.count,
+            "count_strategy": self.page.paginator.count_strategy,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_strategy"] = {
+            "type": "string",
+            "enum": [EXACT, CACHED, ESTIMATED],
+        }
+        return response_schema
+
+
+class KeysetPagination(PageSizeMixin, BasePagination):
+    """
+    Cursor pagination over a `(timestamp, id)` key, newest first.
+
+    Instead of OFFSET, the next page is selected with
+    `timestamp <= t AND (timestamp < t OR id < i)`, where `(t, i)` is the
+    key of the last row of the previous page. The first condition lets
+    PostgreSQL start the scan of a `(-timestamp, -id)` index right at the
+    cursor, so every page costs the same however deep it is. No total
+    count is computed.
+
+    The key is taken from the view's `keyset_fields`. Any ordering set
+    on the queryset is replaced by the key ordering.
+
+    Attributes:
+        cursor_query_param (str): The query parameter holding the cursor.
+        invalid_cursor_message (str): The error for malformed cursors.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def encode_cursor(self, values: List[Any]) -> str:
+        """
+        Encode the key of a row as an opaque cursor.
+
+        Args:
+            values (List[Any]): The key values of the row.
+
+        Returns:
+            str: The cursor.
+        """
+
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request: Request) -> Optional[List[Any]]:
+        """
+        Read the cursor from the request.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            Optional[List[Any]]:
+                The key values, or None when the first page is requested.
+
+        Raises:
+            NotFound: If the cursor is malformed.
+        """
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != 2:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view: Any = None
+    ) -> List[Model]:
+        """
+        Return the page of rows following the cursor.
+
+        Args:
+            queryset (QuerySet): The filtered queryset.
+            request (Request): The incoming request.
+            view: The view that requested pagination.
+
+        Returns:
+            List[Model]: The rows of the page.
+
+        Raises:
+            NotFound: If the cursor is malformed.
+        """
+
+        self.request = request
+        self.fields: Tuple[str, str] = view.keyset_fields
+        timestamp, pk = self.fields
+        queryset = queryset.order_by(f"-{timestamp}", f"-{pk}")
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(
+                    Q(**{f"{timestamp}__lte": cursor[0]}),
+                    Q(**{f"{timestamp}__lt": cursor[0]})
+                    | Q(**{f"{pk}__lt": cursor[1]}),
+                )
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_link(self) -> Optional[str]:
+        """
+        Build the URL of the next page.
+
+        Returns:
+            Optional[str]: The URL, or None on the last page.
+        """
+
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(
+            [getattr(last, field) for field in self.fields]
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_paginated_response(self, data: List[Any]) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Cursor pagination of the recipes from the authors a user follows.
+
+    Pages are keyed by `(pub_date, id)` like `KeysetPagination`, but the
+    keys come from the user's timeline (see `TimelineEntry.objects.feed`)
+    and only the recipes of the page are loaded from the view's queryset.
+    """
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view: Any = None
+    ) -> List[Model]:
+        """
+        Return the page of recipes following the cursor.
+
+        Args:
+            queryset (QuerySet): The recipe queryset.
+            request (Request): The incoming request.
+            view: The view that requested pagination.
+
+        Returns:
+            List[Model]: The recipes of the page.
+
+        Raises:
+            NotFound: If the cursor is malformed.
+        """
+
+        self.request = request
+        self.fields = ("pub_date", "id")
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                cursor = (parse_datetime(cursor[0]), int(cursor[1]))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if cursor[0] is None:
+                raise NotFound(self.invalid_cursor_message)
+        page_size = self.get_page_size(request)
+        keys = TimelineEntry.objects.feed(
+            request.user.id, page_size + 1, cursor
+        )
+        self.has_next = len(keys) > page_size
+        ids = [pk for _, pk in keys[:page_size]]
+        recipes = queryset.in_bulk(ids)
+        self.page = [recipes[pk] for pk in ids if pk in recipes]
+        return self.page
+
+
+class KeysetPaginationMixin:
+    """
+    Switches a view to `KeysetPagination` when a cursor is requested.
+
+    Requests carrying the `cursor` query parameter (empty for the first
+    page) are paginated by the `keyset_fields` of the view or action;
+    other requests keep the view's `pagination_class`.
+
+    Attributes:
+        keyset_fields (Optional[Tuple[str, str]]):
+            The timestamp and id fields of the key. Views or actions that
+            leave it unset do not support cursor pagination.
+    """
+
+    keyset_fields: Optional[Tuple[str, str]] = None
+
+    @property
+    def paginator(self) -> Optional[BasePagination]:
+        if not hasattr(self, "_paginator"):
+            if (
+                self.keyset_fields is not None
+                and KeysetPagination.cursor_query_param
+                in self.request.query_params
+            ):
+                self._paginator = KeysetPagination()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
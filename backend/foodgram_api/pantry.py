@@ -0,0 +1,772 @@
+import logging
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from time import monotonic
+from typing import (Dict, Iterable, Iterator, List, NamedTuple, Optional,
+                    Tuple, Union)
+
+from django.db import connection
+from django.db.models import Max
+
+from foodgram_api.caching import RECIPES, get_version
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+FULL = (1 << CHUNK_SIZE) - 1
+
+Container = Union[int, array]
+
+logger = logging.getLogger(__name__)
+
+
+class IndexNotReady(Exception):
+    """
+    The pantry index is being built and cannot answer searches yet.
+    """
+
+
+def popcount(bitmap: int) -> int:
+    """
+    Count the set bits of a bitmap, with `int.bit_count()` where the
+    Python version has it (3.10+).
+
+    Args:
+        bitmap (int): The bitmap.
+
+    Returns:
+        int: The number of set bits.
+    """
+
+    return bin(bitmap).count("1")
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count  # noqa: F811
+
+
+def to_bitmap(offsets: Union[Container, Iterable[int]]) -> int:
+    """
+    Turn recipe offsets into a bitmap, where bit `n` stands for the
+    recipe at offset `n` of a chunk.
+
+    Args:
+        offsets: A bitmap, returned as is, or the offsets.
+
+    Returns:
+        int: The bitmap.
+    """
+
+    if isinstance(offsets, int):
+        return offsets
+    bits = bytearray(CHUNK_SIZE // 8)
+    for offset in offsets:
+        bits[offset >> 3] |= 1 << (offset & 7)
+    return int.from_bytes(bits, "little")
+
+
+def bit_planes(counts: List[int]) -> List[int]:
+    """
+    Slice counts into bitmaps: bit `n` of `planes[i]` is bit `i` of
+    `counts[n]`.
+
+    Args:
+        counts (List[int]): A count for every offset of a chunk.
+
+    Returns:
+        List[int]: The bit planes.
+    """
+
+    return [
+        to_bitmap(
+            offset for offset, count in enumerate(counts) if count >> i & 1
+        )
+        for i in range(max(counts, default=0).bit_length())
+    ]
+
+
+def increment(planes: List[int], bitmap: int) -> None:
+    """
+    Add one to the bit-sliced counts of the recipes in a bitmap.
+
+    Args:
+        planes (List[int]): The counts, see `bit_planes`, updated in place.
+        bitmap (int): The recipes to count.
+    """
+
+    carry = bitmap
+    for i, plane in enumerate(planes):
+        planes[i] = plane ^ carry
+        carry &= plane
+        if not carry:
+            return
+    if carry:
+        planes.append(carry)
+
+
+def subtract(minuend: List[int], subtrahend: List[int]) -> List[int]:
+    """
+    Subtract bit-sliced counts, none of which is larger in `subtrahend`.
+
+    Complements are taken with `FULL ^ x`, as bitwise operations on
+    the negative `~x` are several times slower.
+
+    Args:
+        minuend (List[int]): The counts to subtract from.
+        subtrahend (List[int]): The counts to subtract.
+
+    Returns:
+        List[int]: The bit planes of the differences.
+    """
+
+    difference = []
+    borrow = 0
+    for i in range(max(len(minuend), len(subtrahend))):
+        left = minuend[i] if i < len(minuend) else 0
+        right = subtrahend[i] if i < len(subtrahend) else 0
+        difference.append(left ^ right ^ borrow)
+        not_left = FULL ^ left
+        borrow = (not_left & right) | ((not_left ^ right) & borrow)
+    return difference
+
+
+def equal(planes: List[int], value: int, within: int) -> int:
+    """
+    Select the recipes whose bit-sliced count is `value`.
+
+    Args:
+        planes (List[int]): The counts.
+        value (int): The count to look for.
+        within (int): The recipes to select from.
+
+    Returns:
+        int: The bitmap of the selected recipes.
+    """
+
+    if value >> len(planes):
+        return 0
+    for i, plane in enumerate(planes):
+        within &= plane if value >> i & 1 else FULL ^ plane
+    return within
+
+
+def at_most(planes: List[int], value: int, within: int) -> int:
+    """
+    Select the recipes whose bit-sliced count is at most `value`.
+
+    Args:
+        planes (List[int]): The counts.
+        value (int): The largest count selected.
+        within (int): The recipes to select from.
+
+    Returns:
+        int: The bitmap of the selected recipes.
+    """
+
+    if value >> len(planes):
+        return within
+    below = 0
+    for i in reversed(range(len(planes))):
+        if value >> i & 1:
+            below |= within & (FULL ^ planes[i])
+            within &= planes[i]
+        else:
+            within &= FULL ^ planes[i]
+    return below | within
+
+
+def drop_highest(bitmap: int, count: int) -> int:
+    """
+    Clear the `count` highest set bits of a bitmap.
+
+    The cut is found by a binary search over shifts, so skipping many
+    matches costs a few popcounts instead of one step per bit.
+
+    Args:
+        bitmap (int): The bitmap.
+        count (int): The number of bits to clear.
+
+    Returns:
+        int: The remaining bitmap.
+    """
+
+    if count <= 0:
+        return bitmap
+    low, high = 0, bitmap.bit_length()
+    while low < high:
+        middle = (low + high) // 2
+        if popcount(bitmap >> middle) <= count:
+            high = middle
+        else:
+            low = middle + 1
+    return bitmap & ((1 << low) - 1)
+
+
+def descending(bitmap: int) -> Iterator[int]:
+    """
+    Iterate over the set bits of a bitmap, highest first.
+
+    Args:
+        bitmap (int): The bitmap.
+
+    Yields:
+        int: The positions of the set bits.
+    """
+
+    while bitmap:
+        position = bitmap.bit_length() - 1
+        yield position
+        bitmap ^= 1 << position
+
+
+class Chunk:
+    """
+    The part of a `PantryIndex` covering `CHUNK_SIZE` consecutive
+    recipe ids.
+
+    Recipes are stored as bitmaps over their offsets in the chunk.
+    Ingredients used by few recipes of the chunk keep a sorted array of
+    offsets instead, two bytes per recipe rather than a whole bitmap,
+    like the array containers of roaring bitmaps.
+
+    Attributes:
+        recipes (int): The indexed recipes.
+        ingredients (Dict[int, Container]): The recipes using each
+            ingredient.
+        tags (Dict[int, int]): The recipes with each tag.
+        totals (List[int]): The bit-sliced ingredient counts of the
+            recipes, see `bit_planes`.
+    """
+
+    __slots__ = ("recipes", "ingredients", "tags", "totals")
+
+    def __init__(self) -> None:
+        self.recipes = 0
+        self.ingredients: Dict[int, Container] = {}
+        self.tags: Dict[int, int] = {}
+        self.totals: List[int] = []
+
+    def add(
+        self, offset: int, ingredient_ids: List[int], tag_ids: List[int],
+        sparse_limit: int
+    ) -> None:
+        """
+        Index a recipe that is not in the chunk.
+
+        Args:
+            offset (int): The offset of the recipe.
+            ingredient_ids (List[int]): Its distinct ingredients.
+            tag_ids (List[int]): Its tags.
+            sparse_limit (int): The largest number of offsets kept in an
+                array.
+        """
+
+        bit = 1 << offset
+        self.recipes |= bit
+        for pk in ingredient_ids:
+            container = self.ingredients.get(pk, array("H"))
+            if isinstance(container, int):
+                container |= bit
+            else:
+                insort(container, offset)
+                if len(container) > sparse_limit:
+                    container = to_bitmap(container)
+            self.ingredients[pk] = container
+        for pk in tag_ids:
+            self.tags[pk] = self.tags.get(pk, 0) | bit
+        count = len(ingredient_ids)
+        while len(self.totals) < count.bit_length():
+            self.totals.append(0)
+        for i in range(count.bit_length()):
+            if count >> i & 1:
+                self.totals[i] |= bit
+
+    def discard(self, offset: int) -> None:
+        """
+        Remove a recipe from the chunk, if it is there.
+
+        Every container of the chunk is visited, as the ingredients the
+        recipe was indexed with are not kept.
+
+        Args:
+            offset (int): The offset of the recipe.
+        """
+
+        bit = 1 << offset
+        if not self.recipes & bit:
+            return
+        keep = FULL ^ bit
+        self.recipes &= keep
+        for pk, container in list(self.ingredients.items()):
+            if isinstance(container, int):
+                if container & bit:
+                    container &= keep
+                    if container:
+                        self.ingredients[pk] = container
+                    else:
+                        del self.ingredients[pk]
+                continue
+            position = bisect_left(container, offset)
+            if position < len(container) and container[position] == offset:
+                del container[position]
+                if not container:
+                    del self.ingredients[pk]
+        for pk, bitmap in list(self.tags.items()):
+            if bitmap & bit:
+                self.tags[pk] = bitmap & keep
+        self.totals = [plane & keep for plane in self.totals]
+
+
+class MatchedChunk(NamedTuple):
+    """
+    The matches of a search in one chunk, with their bit-sliced counts
+    of owned and missing ingredients.
+    """
+
+    first_id: int
+    recipes: int
+    owned: List[int]
+    missing: List[int]
+
+
+class PantryMatch(NamedTuple):
+    """
+    A recipe found by `PantryIndex.search`.
+    """
+
+    recipe_id: int
+    owned: int
+    missing: int
+
+
+class PantryMatches:
+    """
+    The recipes found by `PantryIndex.search`: fewest missing
+    ingredients first, then most owned ingredients, then newest.
+
+    Supports `len()` and slicing, so it can be paginated like a list.
+    A slice only extracts the matches it returns.
+    """
+
+    def __init__(self, chunks: List[MatchedChunk], max_owned: int) -> None:
+        self._chunks = chunks
+        self._max_owned = max_owned
+        self._count = sum(popcount(chunk.recipes) for chunk in chunks)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: slice) -> List[PantryMatch]:
+        start, stop, _ = index.indices(self._count)
+        matches: List[PantryMatch] = []
+        position = 0
+        remaining = [chunk.recipes for chunk in self._chunks]
+        missing_limit = max(
+            (1 << len(chunk.missing) for chunk in self._chunks), default=0
+        )
+        missing = 0
+        while position < stop and missing < missing_limit:
+            left = [
+                equal(chunk.missing, missing, recipes)
+                for chunk, recipes in zip(self._chunks, remaining)
+            ]
+            owned = self._max_owned
+            while position < stop and any(left) and owned > 0:
+                for i, chunk in enumerate(self._chunks):
+                    group = equal(chunk.owned, owned, left[i])
+                    if not group or position >= stop:
+                        continue
+                    left[i] ^= group
+                    remaining[i] ^= group
+                    if position < start:
+                        size = popcount(group)
+                        if position + size <= start:
+                            position += size
+                            continue
+                        group = drop_highest(group, start - position)
+                        position = start
+                    for offset in descending(group):
+                        if position >= stop:
+                            break
+                        matches.append(PantryMatch(
+                            chunk.first_id + offset, owned, missing
+                        ))
+                        position += 1
+                owned -= 1
+            missing += 1
+        return matches
+
+
+class PantryIndex:
+    """
+    Process-local inverted index from ingredients to the recipes using
+    them, answering "what can I cook" searches without querying the
+    database.
+
+    Recipe ids are split into chunks of `CHUNK_SIZE` (see `Chunk`).
+    A search adds up the bitmaps of the owned ingredients into
+    bit-sliced counters, so every step is a bitwise operation over a
+    whole chunk, and subtracts them from the ingredient counts of the
+    recipes to get the number of missing ingredients.
+
+    The index is built in a background thread, started by `start()`
+    when a worker boots or by the first search, which raises
+    `IndexNotReady` until the build is installed. It is rebuilt the same
+    way once it is older than `ttl` seconds, while searches keep using
+    the current one. In between, recipes whose `updated_at` moved are
+    re-indexed when the recipes version changes, or every
+    `sync_interval` seconds in case version bumps made by other workers
+    are not visible to this one. The check queries the database outside
+    the lock, and searches arriving while it runs do not wait for it.
+    Recipes saved up to `sync_overlap` before the newest change seen are
+    checked again, covering transactions that committed late. Deleted
+    recipes are dropped by this worker's deletion signal, by
+    `discard()` when a search runs into them, and by the next rebuild.
+
+    Attributes:
+        ttl (int): Maximum age of the index in seconds.
+        sync_interval (int): Seconds between checks for changed recipes.
+        sync_overlap (timedelta): How far back changes are re-checked.
+        sparse_limit (int): The largest number of recipes of a chunk
+            kept as an array of offsets rather than a bitmap.
+    """
+
+    ttl = 3600
+    sync_interval = 5
+    sync_overlap = timedelta(minutes=1)
+    sparse_limit = 128
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._chunks: Dict[int, Chunk] = {}
+        self._version = None
+        self._built_at: Optional[float] = None
+        self._rebuilding = False
+        self._syncing = False
+        self._checked_at = 0.0
+        self._synced_to: Optional[datetime] = None
+        self._recent: Dict[int, datetime] = {}
+
+    def start(self) -> None:
+        """
+        Start building the index in a background thread, unless it is
+        built or being built.
+        """
+
+        with self._lock:
+            if self._built_at is None:
+                self._start_rebuild()
+
+    def _start_rebuild(self) -> None:
+        """
+        Start `_rebuild()` in a background thread unless one is running.
+        Must be called with the lock held.
+        """
+
+        if self._rebuilding:
+            return
+        self._rebuilding = True
+        Thread(
+            target=self._rebuild, name="pantry-index-rebuild", daemon=True
+        ).start()
+
+    def _refresh(self) -> None:
+        """
+        Start a build if there is no index or it has expired, and apply
+        the recipe changes made since the last check.
+
+        Raises:
+            IndexNotReady: The index is not built yet.
+        """
+
+        version = get_version(RECIPES)
+        now = monotonic()
+        with self._lock:
+            if self._built_at is None:
+                self._start_rebuild()
+                raise IndexNotReady
+            if now - self._built_at >= self.ttl:
+                self._start_rebuild()
+            if self._syncing or (
+                version == self._version
+                and now - self._checked_at < self.sync_interval
+            ):
+                return
+            self._syncing = True
+        try:
+            self._sync()
+            self._version = version
+        finally:
+            self._syncing = False
+
+    def _load(self) -> Tuple[Dict[int, Chunk], Optional[datetime]]:
+        """
+        Index all recipes from scratch.
+
+        Rows are read without `DISTINCT`, which would sort the whole
+        table; an ingredient repeated in a recipe is counted once here.
+
+        Returns:
+            Tuple[Dict[int, Chunk], Optional[datetime]]: The chunks by
+                number, and the latest `updated_at` before the build.
+        """
+
+        synced_to = Recipe.objects.aggregate(
+            latest=Max("updated_at")
+        )["latest"]
+        offsets = defaultdict(list)
+        counts = defaultdict(lambda: [0] * CHUNK_SIZE)
+        for recipe_id, ingredient_id in (
+            RecipeIngredient.objects.order_by()
+            .values_list("recipe_id", "ingredient_id")
+            .iterator(chunk_size=20000)
+        ):
+            number, offset = recipe_id >> CHUNK_BITS, recipe_id & CHUNK_MASK
+            offsets[number, ingredient_id].append(offset)
+            counts[number][offset] += 1
+        tags = defaultdict(list)
+        for recipe_id, tag_id in (
+            RecipeTag.objects.order_by()
+            .values_list("recipe_id", "tag_id")
+            .iterator(chunk_size=20000)
+        ):
+            tags[recipe_id >> CHUNK_BITS, tag_id].append(
+                recipe_id & CHUNK_MASK
+            )
+        chunks = defaultdict(Chunk)
+        for (number, pk), ingredient_offsets in offsets.items():
+            unique = sorted(set(ingredient_offsets))
+            if len(unique) < len(ingredient_offsets):
+                for offset, count in Counter(ingredient_offsets).items():
+                    counts[number][offset] -= count - 1
+            chunks[number].ingredients[pk] = (
+                to_bitmap(unique) if len(unique) > self.sparse_limit
+                else array("H", unique)
+            )
+        for number, chunk_counts in counts.items():
+            chunks[number].totals = bit_planes(chunk_counts)
+            chunks[number].recipes = to_bitmap(
+                offset for offset, count in enumerate(chunk_counts) if count
+            )
+        for (number, pk), tag_offsets in tags.items():
+            if number in chunks:
+                chunks[number].tags[pk] = (
+                    to_bitmap(tag_offsets) & chunks[number].recipes
+                )
+        return dict(chunks), synced_to
+
+    def _install(
+        self, chunks: Dict[int, Chunk], synced_to: Optional[datetime]
+    ) -> None:
+        """
+        Replace the index with freshly loaded chunks. Changes made while
+        they were loaded are applied by the next `_sync()`.
+
+        Args:
+            chunks (Dict[int, Chunk]): The chunks by number.
+            synced_to (Optional[datetime]): The latest `updated_at`
+                before they were loaded.
+        """
+
+        self._chunks = chunks
+        self._synced_to = synced_to
+        self._recent = {}
+        self._built_at = monotonic()
+        self._checked_at = 0.0
+
+    def build(self) -> None:
+        """
+        Build the index in the calling thread and install it.
+        """
+
+        loaded = self._load()
+        with self._lock:
+            self._install(*loaded)
+
+    def _rebuild(self) -> None:
+        """
+        Build the index in a background thread while searches keep using
+        the current one, if any. A failed rebuild is retried once the
+        index expires again, a failed first build by the next search.
+        """
+
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Cannot build the pantry index")
+            with self._lock:
+                if self._built_at is not None:
+                    self._built_at = monotonic()
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def _sync(self) -> None:
+        """
+        Re-index the recipes saved since the last check.
+
+        The changes are read without the lock and applied with it, unless
+        a rebuild was installed in between; the next check then starts
+        from the rebuilt index.
+        """
+
+        with self._lock:
+            built_at = self._built_at
+            synced_to = self._synced_to
+            recent = self._recent
+        recipes = Recipe.objects.order_by()
+        if synced_to is not None:
+            recipes = recipes.filter(
+                updated_at__gte=synced_to - self.sync_overlap
+            )
+        rows = dict(recipes.values_list("id", "updated_at"))
+        changed = [
+            pk for pk, updated_at in rows.items()
+            if recent.get(pk) != updated_at
+        ]
+        ingredients, tags = self._read(changed)
+        with self._lock:
+            if self._built_at != built_at:
+                return
+            self._recent = rows
+            if rows:
+                latest = max(rows.values())
+                if self._synced_to is None or latest > self._synced_to:
+                    self._synced_to = latest
+            self._reindex(changed, ingredients, tags)
+            self._checked_at = monotonic()
+
+    def _read(
+        self, recipe_ids: List[int]
+    ) -> Tuple[Dict[int, set], Dict[int, list]]:
+        """
+        Read the current ingredients and tags of some recipes.
+
+        Args:
+            recipe_ids (List[int]): The recipes.
+
+        Returns:
+            Tuple[Dict[int, set], Dict[int, list]]: The ingredient ids
+                and the tag ids by recipe id, empty for missing recipes.
+        """
+
+        ingredients = defaultdict(set)
+        tags = defaultdict(list)
+        if not recipe_ids:
+            return ingredients, tags
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "ingredient_id"):
+            ingredients[recipe_id].add(ingredient_id)
+        for recipe_id, tag_id in RecipeTag.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list("recipe_id", "tag_id"):
+            tags[recipe_id].append(tag_id)
+        return ingredients, tags
+
+    def _reindex(
+        self, recipe_ids: List[int], ingredients: Dict[int, set],
+        tags: Dict[int, list]
+    ) -> None:
+        """
+        Replace the index entries of some recipes with their ingredients
+        and tags, as returned by `_read()`. Must be called with the lock
+        held.
+
+        Args:
+            recipe_ids (List[int]): The recipes.
+            ingredients (Dict[int, set]): Their ingredient ids.
+            tags (Dict[int, list]): Their tag ids.
+        """
+
+        for pk in recipe_ids:
+            number, offset = pk >> CHUNK_BITS, pk & CHUNK_MASK
+            chunk = self._chunks.get(number)
+            if chunk is not None:
+                chunk.discard(offset)
+            if ingredients[pk]:
+                if chunk is None:
+                    chunk = self._chunks[number] = Chunk()
+                chunk.add(
+                    offset, list(ingredients[pk]), tags[pk], self.sparse_limit
+                )
+
+    def discard(self, recipe_ids: Iterable[int]) -> None:
+        """
+        Remove deleted recipes from the index.
+
+        Args:
+            recipe_ids (Iterable[int]): The recipes.
+        """
+
+        with self._lock:
+            for pk in recipe_ids:
+                chunk = self._chunks.get(pk >> CHUNK_BITS)
+                if chunk is not None:
+                    chunk.discard(pk & CHUNK_MASK)
+
+    def search(
+        self, ingredient_ids: Iterable[int],
+        max_missing: Optional[int] = None,
+        tag_ids: Optional[Iterable[int]] = None,
+    ) -> PantryMatches:
+        """
+        Find the recipes using at least one of the given ingredients.
+
+        Args:
+            ingredient_ids (Iterable[int]): The ingredients at hand.
+            max_missing (Optional[int]): The largest number of other
+                ingredients a recipe may need, unlimited when None.
+            tag_ids (Optional[Iterable[int]]): Tags, one of which the
+                recipes must have. No tag filter when None.
+
+        Returns:
+            PantryMatches: The matching recipes, ranked.
+
+        Raises:
+            IndexNotReady: The index is not built yet.
+        """
+
+        pantry = set(ingredient_ids)
+        tag_ids = None if tag_ids is None else set(tag_ids)
+        matched = []
+        self._refresh()
+        with self._lock:
+            for number in sorted(self._chunks, reverse=True):
+                chunk = self._chunks[number]
+                allowed = chunk.recipes
+                if tag_ids is not None:
+                    allowed = 0
+                    for pk in tag_ids:
+                        allowed |= chunk.tags.get(pk, 0)
+                owned: List[int] = []
+                recipes = 0
+                for pk in pantry:
+                    container = chunk.ingredients.get(pk)
+                    if container is not None:
+                        bitmap = to_bitmap(container)
+                        recipes |= bitmap
+                        increment(owned, bitmap)
+                recipes &= allowed
+                if not recipes:
+                    continue
+                missing = subtract(chunk.totals, owned)
+                if max_missing is not None:
+                    recipes = at_most(missing, max_missing, recipes)
+                if recipes:
+                    matched.append(MatchedChunk(
+                        number << CHUNK_BITS, recipes, owned, missing
+                    ))
+        return PantryMatches(
+            matched,
+            min(len(pantry), max(
+                ((1 << len(chunk.owned)) - 1 for chunk in matched), default=0
+            )),
+        )
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,307 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from itertools import chain
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+ShoppingListRow = Tuple[str, str, int]
+
+
+class LineBuffer:
+    """
+    File-like object that hands back whatever is written to it,
+    letting `csv.writer` produce one formatted line at a time.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class ZipStream:
+    """
+    Write-only, non-seekable file object collecting the output of
+    `ZipFile` until it is drained into the response.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    """
+    Base renderer for shopping list downloads.
+
+    Shopping lists are not rendered from response data: the view passes
+    the aggregated rows to `get_response()`, which streams them in the
+    renderer's format so memory use does not grow with the list. The
+    renderers still take part in content negotiation, so the format can
+    be chosen with `?format=` or the Accept header. `render()` is only
+    used for error payloads, which are rendered as JSON.
+
+    Attributes:
+        headers (tuple): Column titles written before the rows.
+        chunk_size (int): Approximate size of the streamed chunks.
+    """
+
+    charset = "utf-8"
+    headers = ("Ingredient", "Measurement Unit", "Total Amount")
+    chunk_size = 64 * 1024
+
+    def render(
+        self,
+        data: Any,
+        accepted_media_type: Optional[str] = None,
+        renderer_context: Optional[dict] = None,
+    ) -> bytes:
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    @abstractmethod
+    def stream(self, rows: Iterable[ShoppingListRow]) -> Iterator[bytes]:
+        """
+        Encode the shopping list chunk by chunk.
+
+        Args:
+            rows (Iterable[ShoppingListRow]):
+                Ingredient name, measurement unit and total amount.
+
+        Yields:
+            bytes: The next chunk of the document.
+        """
+
+    def buffered(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Join small chunks so that every write is about `chunk_size` long.
+
+        Args:
+            chunks (Iterable[bytes]): The chunks produced by `stream()`.
+
+        Yields:
+            bytes: The joined chunks.
+        """
+
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.chunk_size:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b"".join(buffer)
+
+    def get_response(
+        self, rows: Iterable[ShoppingListRow], filename: str
+    ) -> StreamingHttpResponse:
+        """
+        Build a streaming attachment response for the shopping list.
+
+        Args:
+            rows (Iterable[ShoppingListRow]): The shopping list rows.
+            filename (str): The file name without an extension.
+
+        Returns:
+            StreamingHttpResponse: The response streaming the document.
+        """
+
+        response = StreamingHttpResponse(
+            self.buffered(self.stream(rows)),
+            content_type=f"{self.media_type}; charset={self.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{filename}.{self.format}"'
+        )
+        return response
+
+
+class ShoppingListXLSXRenderer(ShoppingListRenderer):
+    """
+    Renders the shopping list as an Excel workbook.
+
+    Writes a minimal single-sheet workbook straight into a zip stream,
+    using inline strings so no shared string table is kept in memory.
+    Compressed bytes are handed out as soon as `chunk_size` is reached.
+    """
+
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    format = "xlsx"
+    charset = None
+    columns = "ABC"
+    parts = (
+        (
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+            'content-types">'
+            '<Default Extension="rels" ContentType="application/'
+            'vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"'
+            '/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType='
+            '"application/vnd.openxmlformats-officedocument.spreadsheetml.'
+            'worksheet+xml"/>'
+            '</Types>',
+        ),
+        (
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+            '2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/>'
+            '</Relationships>',
+        ),
+        (
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/'
+            'spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats'
+            '.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Shopping List" sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>',
+        ),
+        (
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+            '2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/worksheet" '
+            'Target="worksheets/sheet1.xml"/>'
+            '</Relationships>',
+        ),
+    )
+    sheet_header = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+        '2006/main"><sheetData>'
+    )
+    sheet_footer = "</sheetData></worksheet>"
+
+    def format_row(self, number: int, values: Iterable[Any]) -> str:
+        """
+        Build the sheet XML of a single row.
+
+        Args:
+            number (int): The 1-based row number.
+            values (Iterable[Any]): The cell values.
+
+        Returns:
+            str: The `<row>` element.
+        """
+
+        cells = []
+        for column, value in zip(self.columns, values):
+            reference = f"{column}{number}"
+            if isinstance(value, (int, float)):
+                cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+            else:
+                cells.append(
+                    f'<c r="{reference}" t="inlineStr">'
+                    f"<is><t>{escape(str(value))}</t></is></c>"
+                )
+        return f'<row r="{number}">{"".join(cells)}</row>'
+
+    def stream(self, rows: Iterable[ShoppingListRow]) -> Iterator[bytes]:
+        output = ZipStream()
+        with ZipFile(output, "w", ZIP_DEFLATED) as archive:
+            for name, content in self.parts:
+                archive.writestr(name, content)
+            with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+                sheet.write(self.sheet_header.encode())
+                for number, row in enumerate(chain([self.headers], rows), 1):
+                    sheet.write(self.format_row(number, row).encode())
+                    if output.size >= self.chunk_size:
+                        yield output.drain()
+                sheet.write(self.sheet_footer.encode())
+        yield output.drain()
+
+    def get_response(
+        self, rows: Iterable[ShoppingListRow], filename: str
+    ) -> StreamingHttpResponse:
+        response = StreamingHttpResponse(
+            self.stream(rows), content_type=self.media_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{filename}.{self.format}"'
+        )
+        return response
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """
+    Renders the shopping list as CSV.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, rows: Iterable[ShoppingListRow]) -> Iterator[bytes]:
+        writer = csv.writer(LineBuffer())
+        yield writer.writerow(self.headers).encode(self.charset)
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    """
+    Renders the shopping list as plain text, one ingredient per line.
+    """
+
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, rows: Iterable[ShoppingListRow]) -> Iterator[bytes]:
+        for name, measurement_unit, amount in rows:
+            yield f"{name} ({measurement_unit}) — {amount}\n".encode(
+                self.charset
+            )
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    """
+    Renders the shopping list as a JSON array of objects.
+    """
+
+    media_type = "application/json"
+    format = "json"
+
+    def stream(self, rows: Iterable[ShoppingListRow]) -> Iterator[bytes]:
+        separator = "["
+        for name, measurement_unit, amount in rows:
+            item = json.dumps(
+                {
+                    "name": name,
+                    "measurement_unit": measurement_unit,
+                    "amount": amount,
+                },
+                ensure_ascii=False,
+            )
+            yield f"{separator}{item}".encode(self.charset)
+            separator = ","
+        yield ("[]" if separator == "[" else "]").encode(self.charset)
@@ -0,0 +1,172 @@
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+from foodgram_api.caching import CATALOGUE, get_version
+from recipes.models import Ingredient
+
+LATIN_TO_CYRILLIC_LAYOUT = str.maketrans(
+    "`qwertyuiop[]asdfghjkl;'zxcvbnm,.",
+    "ёйцукенгшщзхъфывапролджэячсмитьбю",
+)
+
+
+def normalize(value: str) -> str:
+    """
+    Normalize a string for case-insensitive matching.
+
+    Applies Unicode case folding, collapses whitespace and treats
+    "ё" as "е", as Russian texts use them interchangeably.
+
+    Args:
+        value (str): The string to normalize.
+
+    Returns:
+        str: The normalized string.
+    """
+
+    return " ".join(value.casefold().split()).replace("ё", "е")
+
+
+def switch_layout(value: str) -> str:
+    """
+    Re-type a string typed with the Latin keyboard layout as Cyrillic.
+
+    Args:
+        value (str): The casefolded string, e.g. "vjkjrj".
+
+    Returns:
+        str: The string as typed on the ЙЦУКЕН layout, e.g. "молоко".
+    """
+
+    return normalize(value.translate(LATIN_TO_CYRILLIC_LAYOUT))
+
+
+class IngredientIndex:
+    """
+    Process-local autocomplete index over ingredient names.
+
+    Keeps the normalized names in a sorted array, so that prefix matches
+    are found with a binary search and substring matches with `str.find`
+    over all names joined into one string, without querying the database.
+    The index is built lazily on first use and rebuilt when the catalogue
+    version changes, or after `ttl` seconds in case version bumps made by
+    other workers are not visible to this one.
+
+    Attributes:
+        ttl (int): Maximum age of the index in seconds.
+    """
+
+    ttl = 300
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._index: Optional[Tuple[Any, ...]] = None
+        self._version = None
+        self._built_at = 0.0
+
+    def _is_fresh(self, version: int) -> bool:
+        """
+        Check whether the index is built for `version` and younger than
+        `ttl`.
+        """
+
+        return (
+            self._index is not None
+            and self._version == version
+            and monotonic() - self._built_at < self.ttl
+        )
+
+    def _load(self) -> Tuple[Any, ...]:
+        """
+        Return the index, building it if it is missing or expired.
+
+        Returns:
+            Tuple[Any, ...]:
+                The sorted normalized names, the matching serialized
+                ingredients, the names joined with newlines and the offset
+                of every name in the joined string.
+        """
+
+        version = get_version(CATALOGUE)
+        index = self._index
+        if index is not None and self._is_fresh(version):
+            return index
+        with self._lock:
+            if not self._is_fresh(version):
+                rows = sorted(
+                    (normalize(name), pk, name, measurement_unit)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        "id", "name", "measurement_unit"
+                    )
+                )
+                keys = [row[0] for row in rows]
+                offsets = []
+                offset = 0
+                for key in keys:
+                    offsets.append(offset)
+                    offset += len(key) + 1
+                self._built_at = monotonic()
+                self._version = version
+                self._index = (
+                    keys,
+                    [
+                        {"id": pk, "name": name, "measurement_unit": unit}
+                        for _, pk, name, unit in rows
+                    ],
+                    "\n".join(keys),
+                    offsets,
+                )
+            return self._index
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Find ingredients whose names match the query.
+
+        Names starting with the query come first, followed by names that
+        contain it elsewhere. A query typed with the Latin keyboard layout
+        is also matched as if it was typed with the Cyrillic one.
+
+        Args:
+            query (str): The text typed by the user.
+
+        Returns:
+            List[Dict[str, Any]]:
+                Serialized ingredients, ranked as described above.
+        """
+
+        keys, items, haystack, offsets = self._load()
+        queries = [normalize(query)]
+        switched = switch_layout(queries[0])
+        if switched != queries[0]:
+            queries.append(switched)
+        queries = [value for value in queries if value]
+
+        seen = set()
+        prefix_matches = []
+        for value in queries:
+            position = bisect_left(keys, value)
+            while position < len(keys) and keys[position].startswith(value):
+                if position not in seen:
+                    seen.add(position)
+                    prefix_matches.append(position)
+                position += 1
+
+        substring_matches = set()
+        for value in queries:
+            found = haystack.find(value)
+            while found != -1:
+                position = bisect_right(offsets, found) - 1
+                if position not in seen:
+                    substring_matches.add(position)
+                next_name = offsets[position] + len(keys[position])
+                found = haystack.find(value, next_name)
+        substring_matches = sorted(substring_matches)
+        return [items[position] for position in prefix_matches] + [
+            items[position] for position in substring_matches
+        ]
+
+
+ingredient_index = IngredientIndex()
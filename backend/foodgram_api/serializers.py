@@ -1,10 +1,13 @@
 from typing import Any, Dict, List
 
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from foodgram_api.fields import RecipeImageField, RecipeImagesField
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag,
+                            tags_mask_of)
 from users.serializers import CustomUserSerializer
 
 
@@ -71,6 +74,12 @@ class RecipeSerializer(serializers.ModelSerializer):
         is_in_shopping_cart (SerializerMethodField):
             Field to check if the recipe is in the
             shopping cart of the current user.
+        images (RecipeImagesField):
+            URLs of the image resized for small, card and full display.
+        favorites_count (IntegerField):
+            How many users have favorited the recipe.
+        updated_at (DateTimeField):
+            When the recipe, its ingredients or tags last changed.
     """
 
     tags = TagSerializer(many=True)
@@ -80,12 +89,14 @@ class RecipeSerializer(serializers.ModelSerializer):
         method_name="get_is_favorited")
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name="get_is_in_shopping_cart")
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
         fields = [
             "id", "tags", "author", "ingredients", "is_favorited",
-            "is_in_shopping_cart", "name", "image", "text", "cooking_time"]
+            "is_in_shopping_cart", "name", "image", "images", "text",
+            "cooking_time", "favorites_count", "updated_at"]
 
     def get_ingredients(self, obj: Recipe) -> List[Dict[str, Any]]:
         """
@@ -98,7 +109,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             List[Dict[str, Any]]: A list of ingredients in the recipe.
         """
 
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipeingredient_set.all()
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj: Recipe) -> bool:
@@ -114,12 +125,32 @@ class RecipeSerializer(serializers.ModelSerializer):
             False otherwise.
         """
 
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         request = self.context.get("request")
         if request and not request.user.is_anonymous:
             return Favorite.objects.filter(
                 user=request.user, recipe=obj).exists()
         return False
 
+    def to_representation(self, instance: Recipe) -> Dict[str, Any]:
+        """
+        Convert a recipe instance into a dictionary representation.
+
+        Hands the `is_author_subscribed` annotation, when present, over to
+        the author so that `CustomUserSerializer` does not query for it.
+
+        Args:
+            instance (Recipe): The recipe instance to represent.
+
+        Returns:
+            Dict[str, Any]: The dictionary representation of the recipe.
+        """
+
+        if hasattr(instance, "is_author_subscribed"):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
     def get_is_in_shopping_cart(self, obj: Recipe) -> bool:
         """
         Check if the recipe is in the shopping cart of the current user.
@@ -133,6 +164,8 @@ class RecipeSerializer(serializers.ModelSerializer):
                 False otherwise.
         """
 
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if request and not request.user.is_anonymous:
             return ShoppingCart.objects.filter(
@@ -171,8 +204,9 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             Serializer for adding multiple ingredients to the recipe.
         tags (PrimaryKeyRelatedField):
             Field for selecting tags for the recipe.
-        image (Base64ImageField):
-            Field for the recipe image in base64 format, required.
+        image (RecipeImageField):
+            The recipe image, required. Accepted as a base64 string in
+            JSON or as a file in a multipart request.
         cooking_time (IntegerField):
             The cooking time for the recipe,
             with minimum and maximum value constraints.
@@ -182,7 +216,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     ingredients = AddRecipeIngredientSerializer(many=True)
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True)
-    image = Base64ImageField(required=True)
+    image = RecipeImageField(required=True)
     cooking_time = serializers.IntegerField(
         write_only=True, min_value=1, max_value=32000)
 
@@ -215,6 +249,11 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         """
         Validate the list of ingredients for a recipe.
 
+        All ingredient ids are resolved with one query, and every unknown
+        id is reported. The resolved ingredients are kept in the validated
+        data under `ingredient`, so creating the recipe needs no further
+        lookups.
+
         Args:
             ingredients (List[Dict[str, Any]]):
                 A list of ingredients with their IDs and amounts.
@@ -230,13 +269,20 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         """
 
         ingredient_ids = [ingredient["id"] for ingredient in ingredients]
-        if not Ingredient.objects.filter(id__in=ingredient_ids).exists():
-            raise serializers.ValidationError(
-                "One or more ingredients do not exist.")
         if len(set(ingredient_ids)) != len(ingredient_ids):
             raise serializers.ValidationError(
                 "Ingredients must not be repetitive.")
-        return ingredients
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = [pk for pk in ingredient_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                "Ingredients with these ids do not exist: "
+                f"{', '.join(map(str, missing))}."
+            )
+        return [
+            {**ingredient, "ingredient": found[ingredient["id"]]}
+            for ingredient in ingredients
+        ]
 
     def validate_tags(self, tags: List[Tag]) -> List[Tag]:
         """
@@ -295,31 +341,19 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
         Args:
             ingredients (List[Dict[str, Any]]):
-                A list of ingredient data.
+                A list of ingredient data, as returned by
+                `validate_ingredients`.
             recipe (Recipe):
                 The recipe instance to which the ingredients belong.
-
-        Raises:
-            serializers.ValidationError:
-                If an ingredient does not exist.
         """
 
-        ingredient_objs = []
-        for ingredient_data in ingredients:
-            try:
-                ingredient = Ingredient.objects.get(id=ingredient_data["id"])
-                ingredient_objs.append(
-                    RecipeIngredient(
-                        ingredient=ingredient, recipe=recipe,
-                        amount=ingredient_data["amount"]
-                    )
-                )
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    f"Ingredient with id {ingredient_data['id']}"
-                    " does not exist."
-                )
-        RecipeIngredient.objects.bulk_create(ingredient_objs)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                ingredient=ingredient_data["ingredient"], recipe=recipe,
+                amount=ingredient_data["amount"]
+            )
+            for ingredient_data in ingredients
+        )
 
     def create_tags(self, tags, recipe):
         """
@@ -335,6 +369,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         tag_objs = [RecipeTag(recipe=recipe, tag=tag) for tag in tags]
         RecipeTag.objects.bulk_create(tag_objs)
 
+    @transaction.atomic
     def create(self, validated_data: Dict[str, Any]) -> Recipe:
         """
         Create a new recipe instance based on validated data.
@@ -352,16 +387,113 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         author = self.context.get("request").user
-        recipe = Recipe.objects.create(author=author, **validated_data)
+        recipe = Recipe.objects.create(
+            author=author, tags_mask=tags_mask_of(tags), **validated_data
+        )
         self.create_ingredients(ingredients, recipe)
         self.create_tags(tags, recipe)
+        recipes = Recipe.objects.filter(pk=recipe.pk)
+        recipes.update_search_vector()
+        recipes.update_similarity_bands()
         return recipe
 
+    def update_ingredients(
+            self, recipe: Recipe, ingredients: List[Dict[str, Any]]) -> bool:
+        """
+        Bring the ingredient rows of a recipe in line with new data.
+
+        The recipe row and the existing ingredient rows are locked, the
+        rows are compared with the new data, and only the difference is
+        written: removed ingredients are deleted, changed amounts updated
+        and new ingredients inserted. Carts holding the recipe are updated
+        accordingly.
+
+        Args:
+            recipe (Recipe):
+                The recipe being updated.
+            ingredients (List[Dict[str, Any]]):
+                A list of ingredient data, as returned by
+                `validate_ingredients`.
+
+        Returns:
+            bool: Whether any ingredient row changed.
+        """
+
+        ShoppingListItem.objects.lock_recipe(recipe.pk)
+        rows = RecipeIngredient.objects.select_for_update().filter(
+            recipe=recipe).order_by("pk")
+        old_amounts = {}
+        existing = {}
+        to_delete = []
+        for row in rows:
+            old_amounts[row.ingredient_id] = (
+                old_amounts.get(row.ingredient_id, 0) + row.amount)
+            if row.ingredient_id in existing:
+                to_delete.append(row.pk)
+            else:
+                existing[row.ingredient_id] = row
+        amounts = {
+            ingredient_data["ingredient"].pk: ingredient_data["amount"]
+            for ingredient_data in ingredients
+        }
+        to_delete += [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        to_update = []
+        to_create = []
+        for ingredient_data in ingredients:
+            row = existing.get(ingredient_data["ingredient"].pk)
+            if row is None:
+                to_create.append(RecipeIngredient(
+                    ingredient=ingredient_data["ingredient"], recipe=recipe,
+                    amount=ingredient_data["amount"]
+                ))
+            elif row.amount != ingredient_data["amount"]:
+                row.amount = ingredient_data["amount"]
+                to_update.append(row)
+        if not (to_delete or to_update or to_create):
+            return False
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ["amount"])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        ShoppingListItem.objects.update_recipe(recipe.pk, old_amounts)
+        return True
+
+    def update_tags(self, recipe: Recipe, tags: List[Tag]) -> bool:
+        """
+        Set the tags of a recipe and its `tags_mask` unless they are
+        unchanged; the caller saves the mask.
+
+        Args:
+            recipe (Recipe):
+                The recipe being updated.
+            tags (List[Tag]):
+                The new tags.
+
+        Returns:
+            bool: Whether the tags changed.
+        """
+
+        if {tag.pk for tag in recipe.tags.all()} == {tag.pk for tag in tags}:
+            return False
+        recipe.tags.set(tags)
+        recipe.tags_mask = tags_mask_of(tags)
+        return True
+
+    @transaction.atomic
     def update(
             self, instance: Recipe, validated_data: Dict[str, Any]) -> Recipe:
         """
         Update an existing recipe instance.
 
+        Only what changed is written: ingredients and tags are compared
+        with the stored ones, and the recipe row is saved with the changed
+        fields only, or not at all when nothing changed.
+
         Args:
             instance (Recipe):
                 The existing recipe instance to update.
@@ -373,18 +505,22 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         """
 
         ingredients = validated_data.pop("ingredients", None)
-        if ingredients is not None:
-            RecipeIngredient.objects.filter(recipe=instance).delete()
-            self.create_ingredients(ingredients, instance)
+        ingredients_changed = ingredients is not None and \
+            self.update_ingredients(instance, ingredients)
         tags = validated_data.pop("tags", None)
-        if tags is not None:
-            instance.tags.set(tags)
-        image = validated_data.pop("image", None)
-        if image is not None:
-            instance.image = image
+        tags_changed = tags is not None and self.update_tags(instance, tags)
+        changed_fields = ["tags_mask"] if tags_changed else []
         for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+            if attr == "image" or getattr(instance, attr) != value:
+                setattr(instance, attr, value)
+                changed_fields.append(attr)
+        if changed_fields or ingredients_changed or tags_changed:
+            instance.save(update_fields=[*changed_fields, "updated_at"])
+        recipes = Recipe.objects.filter(pk=instance.pk)
+        if ingredients_changed or {"name", "text"} & set(changed_fields):
+            recipes.update_search_vector()
+        if ingredients_changed:
+            recipes.update_similarity_bands()
         return instance
 
     def to_representation(self, instance: Recipe) -> Dict[str, Any]:
@@ -398,6 +534,14 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             Dict[str, Any]: The dictionary representation of the recipe.
         """
 
+        prefetch_related_objects(
+            [instance],
+            "tags",
+            Prefetch(
+                "recipeingredient_set",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            ),
+        )
         return RecipeSerializer(
             instance, context={"request": self.context.get("request")}).data
 
@@ -413,13 +557,17 @@ class FavoriteSerializer(serializers.ModelSerializer):
             The name of the recipe.
         image (ImageField):
             The image of the recipe.
+        images (RecipeImagesField):
+            URLs of the image resized for small, card and full display.
         cooking_time (IntegerField):
             The cooking time of the recipe.
     """
 
+    images = RecipeImagesField()
+
     class Meta:
         model = Recipe
-        fields = ["id", "name", "image", "cooking_time"]
+        fields = ["id", "name", "image", "images", "cooking_time"]
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -457,3 +605,42 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         context = {"request": request}
         return FavoriteSerializer(
             instance.recipe, context=context).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """
+    Serializer for the recipe ids of a bulk favorite or cart request.
+
+    Attributes:
+        ids (ListField):
+            The ids of the recipes to add or remove, at most 100.
+    """
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    """
+    Serializer for the query of a search by ingredients at hand.
+
+    Attributes:
+        ingredients (ListField):
+            The ids of the ingredients at hand, at most 100.
+        missing (IntegerField):
+            The largest number of other ingredients a recipe may need.
+            Unlimited when omitted.
+        tags (ListField):
+            Tag slugs; recipes with any of these tags match.
+    """
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+    missing = serializers.IntegerField(min_value=0, required=False)
+    tags = serializers.ListField(child=serializers.SlugField(), required=False)
@@ -0,0 +1,302 @@
+from typing import Iterable, Optional, Set
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from foodgram_api.authentication import token_version_name
+from foodgram_api.caching import (CATALOGUE, RECIPES, author_version_name,
+                                  bump_version, recipe_version_name,
+                                  tag_version_name)
+from foodgram_api.counters import counters_of
+from foodgram_api.pantry import pantry_index
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from users.models import Subscription
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_catalogue(**kwargs) -> None:
+    """
+    Bump the catalogue version once a tag or ingredient change is
+    committed, refreshing the prepared catalogue responses and the
+    ingredient autocomplete index.
+    """
+
+    transaction.on_commit(lambda: bump_version(CATALOGUE))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete, m2m_changed], sender=RecipeTag)
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_cached_counts(sender, **kwargs) -> None:
+    """
+    Bump the version of the changed table once the write is committed,
+    invalidating the paginated counts cached over it.
+
+    Logins only touch `last_login` and are ignored.
+    """
+
+    if kwargs.get("update_fields") == frozenset({"last_login"}):
+        return
+    if kwargs.get("action", "post_").startswith("post_"):
+        table = sender._meta.db_table
+        transaction.on_commit(lambda: bump_version(table))
+
+
+def bump_recipe_versions(
+    recipe_ids: Iterable[int],
+    author_ids: Iterable[int] = (),
+    tag_ids: Iterable[int] = (),
+) -> None:
+    """
+    Bump the versions of changed recipes once the write is committed,
+    invalidating the cached anonymous responses that may show them: the
+    recipes themselves, the lists of their authors and tags, and the
+    unfiltered lists (`RECIPES`).
+
+    The authors and tags stored for the recipes at commit time are added
+    to the given ones, which name those a recipe had before the write.
+
+    Args:
+        recipe_ids (Iterable[int]): The changed recipes.
+        author_ids (Iterable[int]): Further authors to invalidate.
+        tag_ids (Iterable[int]): Further tags to invalidate.
+    """
+
+    recipe_ids, author_ids, tag_ids = (
+        set(recipe_ids), set(author_ids), set(tag_ids)
+    )
+
+    def bump() -> None:
+        authors = author_ids | set(
+            Recipe.objects.filter(pk__in=recipe_ids)
+            .values_list("author_id", flat=True)
+        )
+        slugs = Tag.objects.filter(
+            Q(pk__in=tag_ids) | Q(tag_recipes__recipe__in=recipe_ids)
+        ).values_list("slug", flat=True).distinct()
+        for name in [
+            RECIPES,
+            *map(recipe_version_name, recipe_ids),
+            *map(author_version_name, authors),
+            *map(tag_version_name, slugs),
+        ]:
+            bump_version(name)
+
+    transaction.on_commit(bump)
+
+
+def bump_author_versions(author_ids: Iterable[int]) -> None:
+    """
+    Bump the versions of all recipes of some authors once the write is
+    committed, as the cached responses showing them embed the author
+    with its `recipes_count` and `followers_count`.
+
+    Authors without recipes appear in no cached response and are
+    skipped.
+
+    Args:
+        author_ids (Iterable[int]): The changed authors.
+    """
+
+    author_ids = set(author_ids)
+    recipe_ids = list(
+        Recipe.objects.filter(author__in=author_ids)
+        .values_list("pk", flat=True)
+    )
+    if recipe_ids:
+        bump_recipe_versions(recipe_ids, author_ids)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(
+    sender, instance: Recipe, signal, **kwargs
+) -> None:
+    """
+    Invalidate the responses showing a saved or deleted recipe, and
+    those showing the other recipes of its author when its
+    `recipes_count` changed.
+    """
+
+    bump_recipe_versions([instance.pk], [instance.author_id])
+    if kwargs.get("created") or signal is post_delete:
+        bump_author_versions([instance.author_id])
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_favorited_recipe(
+    sender, instance: Favorite, **kwargs
+) -> None:
+    """
+    Invalidate the responses showing the `favorites_count` of a recipe
+    favorited or unfavorited outside the API, which changes favorites
+    with single statements and invalidates the recipes itself.
+    """
+
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_followed_author(
+    sender, instance: Subscription, **kwargs
+) -> None:
+    """
+    Invalidate the responses showing the `followers_count` of a followed
+    or unfollowed author.
+    """
+
+    bump_author_versions([instance.author_id])
+
+
+@receiver([post_save, post_delete], sender=RecipeTag)
+def invalidate_recipe_tag(sender, instance: RecipeTag, **kwargs) -> None:
+    """
+    Invalidate the responses showing a recipe whose tag was assigned or
+    removed, including the lists of that tag.
+    """
+
+    bump_recipe_versions([instance.recipe_id], tag_ids=[instance.tag_id])
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+def invalidate_recipe_tags(
+    sender, instance, action: str, reverse: bool,
+    pk_set: Optional[Set[int]], **kwargs
+) -> None:
+    """
+    Invalidate the responses showing recipes whose tags were changed
+    through `Recipe.tags` or its reverse accessor.
+
+    Cleared tags are collected before the rows are gone.
+    """
+
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        if pk_set is None:
+            pk_set = set(
+                RecipeTag.objects.filter(tag=instance)
+                .values_list("recipe_id", flat=True)
+            )
+        bump_recipe_versions(pk_set, tag_ids=[instance.pk])
+    else:
+        bump_recipe_versions([instance.pk], tag_ids=pk_set or ())
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredient(
+    sender, instance: RecipeIngredient, **kwargs
+) -> None:
+    """
+    Invalidate the responses showing a recipe whose ingredients changed.
+    """
+
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_author(sender, instance, **kwargs) -> None:
+    """
+    Invalidate the responses showing the recipes of a changed author.
+
+    New accounts, logins and users without recipes do not affect any
+    recipe and are ignored.
+    """
+
+    if kwargs.get("created") or kwargs.get("update_fields") == frozenset(
+        {"last_login"}
+    ):
+        return
+    bump_author_versions([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def discard_from_pantry_index(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Drop a deleted recipe from this worker's pantry index once the
+    deletion is committed. Other workers drop it on their next rebuild,
+    or as soon as a search returns it.
+    """
+
+    pk = instance.pk
+    transaction.on_commit(lambda: pantry_index.discard([pk]))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def count_created(
+    sender, instance, created: bool, raw: bool = False, **kwargs
+) -> None:
+    """
+    Increment the counters of the rows a new row points to.
+
+    Fixture loads are left to the `reconcile_counters` command.
+    """
+
+    if created and not raw:
+        for counter in counters_of(sender):
+            counter.change(instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def count_deleted(sender, instance, origin=None, **kwargs) -> None:
+    """
+    Decrement the counters of the rows a deleted row pointed to.
+    """
+
+    for counter in counters_of(sender):
+        counter.change(instance, -1, origin)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs) -> None:
+    """
+    Bump the version of a token once its deletion (logout, or deletion
+    of the user) is committed, dropping it from the authentication
+    caches.
+    """
+
+    name = token_version_name(instance.key)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs) -> None:
+    """
+    Bump the versions of a user's tokens once a change to the user, such
+    as a password change or a deactivation, is committed, so that the
+    authentication caches reload the user.
+
+    Logins only touch `last_login` and are ignored.
+    """
+
+    if kwargs.get("created") or kwargs.get("update_fields") == frozenset(
+        {"last_login"}
+    ):
+        return
+    names = [
+        token_version_name(key)
+        for key in Token.objects.filter(user=instance)
+        .values_list("key", flat=True)
+    ]
+
+    def bump() -> None:
+        for name in names:
+            bump_version(name)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,498 @@
+import base64
+import io
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from typing import Tuple
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from foodgram_api.authentication import token_users
+from foodgram_api.pagination import EXACT
+from foodgram_api.pantry import CHUNK_SIZE, PantryIndex, PantryMatch
+from foodgram_api.views import RecipeViewSet
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag, tags_mask_of)
+
+User = get_user_model()
+
+
+def create_user(username: str) -> User:
+    """
+    Create a user named after `username`.
+    """
+
+    return User.objects.create_user(
+        email=f"{username}@example.com", username=username,
+        first_name=username, last_name=username, password="password-123",
+    )
+
+
+def image_data() -> str:
+    """
+    Encode a small PNG as the data URL accepted by the recipe image field.
+    """
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 30), "red").save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def create_recipes(author: User, count: int, tags, ingredients) -> list:
+    """
+    Insert `count` recipes of `author` with the given tags and
+    ingredients, without running the save signals.
+    """
+
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=author, name=f"Recipe {number}", text="Text",
+            cooking_time=10, image=f"recipes/{number}.png",
+            image_derivatives={"source": f"recipes/{number}.png"},
+            tags_mask=tags_mask_of(tags),
+        )
+        for number in range(count)
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tag)
+        for recipe in recipes for tag in tags
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+        for recipe in recipes for ingredient in ingredients
+    )
+    return recipes
+
+
+@mock.patch.object(RecipeViewSet, "count_strategy", EXACT)
+class RecipeListQueriesTest(APITestCase):
+    """
+    The recipe list costs a fixed number of queries, whatever the page
+    size: the count, the page, its tags and its ingredients. The count
+    is exact, as the estimate depends on the planner statistics.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("reader")
+        tags = [
+            Tag.objects.create(name=name, color=color, slug=name)
+            for name, color in (
+                ("breakfast", "#E26C2D"), ("dinner", "#8775D2")
+            )
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ingredient {number}", measurement_unit="g")
+            for number in range(3)
+        )
+        create_recipes(create_user("author"), 120, tags, ingredients)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, expected: int) -> None:
+        for limit in (6, 100):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(
+                        "/api/recipes/", {"limit": limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(4)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(4)
+
+    def test_same_count_for_every_page_size(self):
+        self.client.force_authenticate(self.user)
+        counts = []
+        for limit in (6, 100):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get("/api/recipes/", {"limit": limit})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class AnonymousResponseCacheTest(APITestCase):
+    """
+    Anonymous recipe responses are served from the default cache
+    backend, the per-process local-memory cache unless configured.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipes(
+            create_user("author"), 3, [],
+            [Ingredient.objects.create(name="Salt", measurement_unit="g")],
+        )[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_cached(self, path: str) -> None:
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_list(self):
+        self.assert_cached("/api/recipes/?limit=2")
+
+    def test_detail(self):
+        self.assert_cached(f"/api/recipes/{self.recipe.pk}/")
+
+
+class PreparedCatalogueTest(APITestCase):
+    """
+    The catalogue lists are served from prepared bytes with ETags under
+    the default settings.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name="breakfast", color="#E26C2D", slug="breakfast")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/tags/", HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(response.status_code, 304)
+
+
+class CachedCountersTest(APITestCase):
+    """
+    Anonymous responses held in the cache show the counters changed by
+    favorites and subscriptions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user("reader")
+        cls.author = create_user("author")
+        cls.recipes = create_recipes(
+            cls.author, 2, [],
+            [Ingredient.objects.create(name="Salt", measurement_unit="g")],
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def write(self, method: str, path: str, status: int) -> None:
+        self.client.force_authenticate(self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(path)
+        self.assertEqual(response.status_code, status)
+        self.client.force_authenticate(None)
+
+    def detail(self, recipe: Recipe) -> dict:
+        response = self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_favorite(self):
+        recipe = self.recipes[0]
+        self.assertEqual(self.detail(recipe)["favorites_count"], 0)
+        self.write("post", f"/api/recipes/{recipe.pk}/favorite/", 201)
+        self.assertEqual(self.detail(recipe)["favorites_count"], 1)
+        self.assertEqual(
+            self.client.get("/api/recipes/").data["results"][-1][
+                "favorites_count"
+            ],
+            1,
+        )
+        self.write("delete", f"/api/recipes/{recipe.pk}/favorite/", 204)
+        self.assertEqual(self.detail(recipe)["favorites_count"], 0)
+
+    def followers(self) -> list:
+        return [
+            self.detail(recipe)["author"]["followers_count"]
+            for recipe in self.recipes
+        ]
+
+    def test_subscription(self):
+        self.assertEqual(self.followers(), [0, 0])
+        self.write("post", f"/api/users/{self.author.pk}/subscribe/", 201)
+        self.assertEqual(self.followers(), [1, 1])
+
+
+class TokenCacheTest(APITestCase):
+    """
+    Repeated tokens are served from the per-worker cache under the
+    default settings, until the token is deleted.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.token = Token.objects.create(user=create_user("reader"))
+
+    def setUp(self):
+        cache.clear()
+        token_users.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def token_queries(self) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/users/me/")
+        self.assertEqual(response.status_code, 200)
+        return sum(
+            Token._meta.db_table in query["sql"] for query in queries
+        )
+
+    def test_cached(self):
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 0)
+        self.assertEqual((token_users.hits, token_users.misses), (1, 1))
+
+    def test_deleted(self):
+        self.token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get("/api/users/me/").status_code, 401)
+
+
+class RecipeWriteQueriesTest(APITestCase):
+    """
+    Creating or updating a recipe costs the same number of queries
+    whatever the number of ingredients: they are resolved with one
+    query and written in bulk.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("author")
+        cls.tag = Tag.objects.create(
+            name="breakfast", color="#E26C2D", slug="breakfast"
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ingredient {number}", measurement_unit="g")
+            for number in range(80)
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, ingredients) -> dict:
+        return {
+            "ingredients": [
+                {"id": ingredient.pk, "amount": 10}
+                for ingredient in ingredients
+            ],
+            "tags": [self.tag.pk],
+            "image": image_data(),
+            "name": "Recipe",
+            "text": "Text",
+            "cooking_time": 10,
+        }
+
+    def create(self, ingredients) -> Tuple[int, int]:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/recipes/", self.recipe_data(ingredients), format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(queries), response.data["id"]
+
+    def update(self, pk: int, ingredients) -> int:
+        data = self.recipe_data(ingredients)
+        del data["image"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f"/api/recipes/{pk}/", data, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(queries)
+
+    def test_create(self):
+        small, _ = self.create(self.ingredients[:2])
+        large, pk = self.create(self.ingredients[:40])
+        self.assertEqual(large, small)
+        self.assertEqual(large, 20)
+        self.assertEqual(
+            Recipe.objects.get(pk=pk).recipeingredient_set.count(), 40
+        )
+
+    def test_update(self):
+        _, pk = self.create(self.ingredients[:2])
+        small = self.update(pk, self.ingredients[2:4])
+        large = self.update(pk, self.ingredients[40:80])
+        self.assertEqual(large, small)
+        self.assertEqual(large, 22)
+        self.assertEqual(
+            set(
+                RecipeIngredient.objects.filter(recipe_id=pk)
+                .values_list("ingredient_id", flat=True)
+            ),
+            {ingredient.pk for ingredient in self.ingredients[40:80]},
+        )
+
+
+class PantryIndexTest(APITestCase):
+    """
+    Pantry searches rank, paginate and follow recipe changes like a
+    brute-force scan of the recipes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        generator = random.Random(1)
+        author = create_user("author")
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=name)
+            for name, color in (
+                ("breakfast", "#E26C2D"), ("dinner", "#8775D2")
+            )
+        ]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ingredient {number}", measurement_unit="g")
+            for number in range(12)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                pk=pk, author=author, name=f"Recipe {pk}", text="Text",
+                cooking_time=10, image=f"recipes/{pk}.png",
+                image_derivatives={"source": f"recipes/{pk}.png"},
+            )
+            for pk in generator.sample(range(1, 3 * CHUNK_SIZE), 300)
+        )
+        rows = []
+        for recipe in recipes:
+            ingredients = generator.sample(
+                cls.ingredients, generator.randint(1, 6)
+            )
+            rows += [
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in ingredients + ingredients[:1]
+            ]
+        RecipeIngredient.objects.bulk_create(rows)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in cls.tags if generator.random() < 0.5
+        )
+
+    def setUp(self):
+        self.index = PantryIndex()
+        self.index.sparse_limit = 4
+        self.index.sync_interval = 0
+        self.index.build()
+
+    def scan(self, pantry, max_missing=None, tag_ids=None) -> list:
+        """
+        Rank the recipes by reading every one of them.
+        """
+
+        recipes = Recipe.objects.prefetch_related("ingredients", "tags")
+        if tag_ids is not None:
+            recipes = recipes.filter(tags__in=tag_ids).distinct()
+        matches = []
+        for recipe in recipes:
+            ingredient_ids = {
+                ingredient.pk for ingredient in recipe.ingredients.all()
+            }
+            owned = len(ingredient_ids & set(pantry))
+            missing = len(ingredient_ids) - owned
+            if owned and (max_missing is None or missing <= max_missing):
+                matches.append(PantryMatch(recipe.pk, owned, missing))
+        matches.sort(
+            key=lambda match: (match.missing, -match.owned, -match.recipe_id)
+        )
+        return matches
+
+    def pantries(self):
+        generator = random.Random(2)
+        for size in (1, 3, 6, 12):
+            yield [
+                ingredient.pk
+                for ingredient in generator.sample(self.ingredients, size)
+            ]
+
+    def test_ranking(self):
+        tag_ids = [self.tags[0].pk]
+        for pantry in self.pantries():
+            for max_missing, tags in (
+                (None, None), (0, None), (2, None), (None, tag_ids),
+                (1, tag_ids),
+            ):
+                with self.subTest(
+                    pantry=pantry, max_missing=max_missing, tags=tags
+                ):
+                    matches = self.index.search(pantry, max_missing, tags)
+                    expected = self.scan(pantry, max_missing, tags)
+                    self.assertEqual(len(matches), len(expected))
+                    self.assertEqual(matches[0:len(matches)], expected)
+
+    def test_pagination_slices(self):
+        for pantry in self.pantries():
+            matches = self.index.search(pantry)
+            expected = self.scan(pantry)
+            for start, stop in (
+                (0, 6), (6, 12), (5, 40), (len(expected) - 3, 500),
+                (len(expected), len(expected) + 6),
+            ):
+                with self.subTest(pantry=pantry, start=start, stop=stop):
+                    self.assertEqual(
+                        matches[start:stop], expected[start:stop]
+                    )
+
+    def test_discard_and_re_add(self):
+        pantry = [ingredient.pk for ingredient in self.ingredients[:4]]
+        discarded = [match.recipe_id for match in self.scan(pantry)[:5]]
+        self.index.search(pantry)
+        self.index.discard(discarded)
+        matches = self.index.search(pantry)
+        self.assertEqual(
+            matches[0:len(matches)],
+            [
+                match for match in self.scan(pantry)
+                if match.recipe_id not in discarded
+            ],
+        )
+        RecipeIngredient.objects.filter(recipe_id__in=discarded).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=pk, ingredient=ingredient, amount=10
+            )
+            for pk in discarded for ingredient in self.ingredients[:3]
+        )
+        Recipe.objects.filter(pk__in=discarded).update(
+            updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        matches = self.index.search(pantry)
+        expected = self.scan(pantry)
+        self.assertEqual(matches[0:len(matches)], expected)
+        self.assertEqual(
+            {match.recipe_id for match in expected[:len(discarded)]},
+            set(discarded),
+        )
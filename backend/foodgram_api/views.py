@@ -1,35 +1,51 @@
 from datetime import datetime
-from io import BytesIO
-from typing import Any, Dict, Type, Union
+from typing import Any, Dict, List, Tuple, Type, Union
 
-import openpyxl
-from django.db import models
+from django.db import models, transaction
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db.models import Exists, OuterRef, Prefetch, QuerySet, Value
 from django.http import HttpRequest, HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from foodgram_api.caching import (CATALOGUE, AnonymousResponseCacheMixin,
+                                  PreparedListMixin, author_version_name,
+                                  bump_version, recipe_version_name,
+                                  tag_version_name)
 from foodgram_api.filters import IngredientSearchFilter, RecipesFilter
-from foodgram_api.pagination import CustomPageNumberPagination
+from foodgram_api.pagination import (ESTIMATED, CustomPageNumberPagination,
+                                     FeedPagination, KeysetPaginationMixin)
+from foodgram_api.pantry import IndexNotReady, pantry_index
 from foodgram_api.permissions import IsOwnerOrAdminOrReadOnly
+from foodgram_api.renderers import (ShoppingListCSVRenderer,
+                                    ShoppingListJSONRenderer,
+                                    ShoppingListTextRenderer,
+                                    ShoppingListXLSXRenderer)
+from foodgram_api.search import ingredient_index
 from foodgram_api.serializers import (CreateRecipeSerializer,
                                       FavoriteSerializer, IngredientSerializer,
+                                      PantrySerializer, RecipeIdsSerializer,
                                       RecipeSerializer, TagSerializer)
+from foodgram_api.signals import bump_recipe_versions
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription
 
 
-class TagsViewSet(ReadOnlyModelViewSet):
+class TagsViewSet(PreparedListMixin, ReadOnlyModelViewSet):
     """
     ViewSet for performing read-only operations on `Tag` model.
 
     Inherits from `ReadOnlyModelViewSet`, allowing only read operations
     such as list and retrieve. Utilizes `TagSerializer` for serialization
-    and deserialization of `Tag` instances.
+    and deserialization of `Tag` instances. The list is served from
+    prepared bytes with an ETag, see `PreparedListMixin`.
 
     Attributes:
         permission_classes (tuple):
@@ -46,13 +62,14 @@ class TagsViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(PreparedListMixin, ReadOnlyModelViewSet):
     """
     ViewSet for performing read-only operations on `Ingredient` model.
 
     Inherits from `ReadOnlyModelViewSet`, allowing only read operations such as
     list and retrieve. Uses `IngredientSerializer` for serialization and
-    deserialization of `Ingredient` instances.
+    deserialization of `Ingredient` instances. The full list is served from
+    prepared bytes with an ETag, see `PreparedListMixin`.
 
     Attributes:
         permission_classes (tuple):
@@ -74,23 +91,143 @@ class IngredientsViewSet(ReadOnlyModelViewSet):
     filter_backends = (IngredientSearchFilter,)
     search_fields = ("^name",)
 
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """
+        List ingredients, answering name searches from memory.
+
+        Requests with a `name` parameter are served by the process-local
+        `ingredient_index` without querying the database.
+
+        Args:
+            request: The incoming HTTP request.
+
+        Returns:
+            The HTTP response object.
+        """
+
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(
+    AnonymousResponseCacheMixin, KeysetPaginationMixin, viewsets.ModelViewSet
+):
     """
     A ViewSet for handling requests for the `Recipe` model.
 
     Inherits from `ModelViewSet`, allowing create, retrieve, update, delete,
     and list operations. It uses different serializers for read and write
     operations and includes custom actions for handling favorites and shopping
-    cart functionality.
+    cart functionality. The list is paginated by page number with an
+    estimated total count, or by `(pub_date, id)` cursors when the
+    `cursor` parameter is given. Responses to anonymous users are cached,
+    see `AnonymousResponseCacheMixin`.
+
+    Recipes are written as JSON with a base64 image, or as
+    `multipart/form-data` with the image as a file, ingredients as
+    `ingredients[<n>]id` and `ingredients[<n>]amount` fields and
+    repeated `tags` fields.
     """
 
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     pagination_class = CustomPageNumberPagination
+    count_strategy = ESTIMATED
+    keyset_fields = ("pub_date", "id")
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
 
+    def initialize_request(
+        self, request: HttpRequest, *args, **kwargs
+    ) -> Request:
+        """
+        Stream uploaded files to temporary files instead of memory.
+
+        Args:
+            request: The incoming HTTP request.
+
+        Returns:
+            The DRF request.
+        """
+
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_anonymous_cache_versions(self, request: Request) -> Tuple[str]:
+        """
+        Name the data sets a cached anonymous response depends on.
+
+        A recipe depends on its own version, a list filtered by author on
+        the author's, and a list filtered by tags on these tags', so that
+        a write only drops the responses that may show the changed
+        recipe (see `foodgram_api.signals`). Other filters only narrow
+        these lists further. Unfiltered lists depend on all recipes.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            Tuple[str]: The data set names.
+        """
+
+        if self.action == "retrieve":
+            return (
+                recipe_version_name(self.kwargs[self.lookup_field]),
+                CATALOGUE,
+            )
+        author = request.query_params.get("author")
+        if author:
+            return author_version_name(author), CATALOGUE
+        tags = sorted(set(request.query_params.getlist("tags")))
+        if tags:
+            return (*(tag_version_name(slug) for slug in tags), CATALOGUE)
+        return self.anonymous_cache_versions
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Build the recipe queryset for the current request.
+
+        Related authors, tags and ingredients are loaded up front and the
+        per-user flags are annotated with `Exists()` subqueries, so that
+        serializing a page costs a fixed number of queries.
+
+        Returns:
+            The annotated recipe queryset.
+        """
+
+        user = self.request.user
+        queryset = Recipe.objects.defer(
+            "search_vector", "similarity_bands"
+        ).select_related(
+            "author"
+        ).prefetch_related(
+            "tags",
+            Prefetch(
+                "recipeingredient_set",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            ),
+        )
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_author_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef("author"))
+            ),
+        )
+
     def get_serializer_class(
         self,
     ) -> Type[Union[RecipeSerializer, CreateRecipeSerializer]]:
@@ -127,6 +264,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         Handle adding or removing a recipe to/from
         a user's favorite or shopping cart list.
 
+        Each change is a single statement (see `RecipeListManager`), and
+        the status code is derived from its result, so concurrent
+        requests for the same recipe get 400 instead of failing on the
+        unique constraint.
+
         Args:
             request:
                 The incoming HTTP request.
@@ -140,43 +282,136 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
 
         try:
-            recipe = Recipe.objects.get(id=pk)
-        except Recipe.DoesNotExist:
-            if request.method == "POST":
+            recipe_id = int(pk)
+        except ValueError:
+            recipe_id = 0
+
+        if request.method == "POST":
+            recipe, added = list_model.objects.add(
+                request.user.id, recipe_id
+            )
+            if recipe is None:
                 return Response(
                     {"error": "The recipe does not exist."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            if request.method == "DELETE":
-                return Response(
-                    {"error": "The recipe does not exist."},
-                    status=status.HTTP_404_NOT_FOUND,
-                )
-
-        if request.method == "POST":
-            if list_model.objects.filter(
-                    user=request.user, recipe=recipe).exists():
+            if not added:
                 return Response(
                     {"errors": "The recipe is already in favorites!"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            list_model.objects.create(user=request.user, recipe=recipe)
+            RecipeViewSet.__list_changed(list_model, [recipe.id])
             serializer = FavoriteSerializer(
                 recipe,
                 context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == "DELETE":
-            favorite_entry = list_model.objects.filter(
-                user=request.user, recipe=recipe)
-            if favorite_entry.exists():
-                favorite_entry.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
+        exists, removed = list_model.objects.remove(request.user.id, recipe_id)
+        if not exists:
+            return Response(
+                {"error": "The recipe does not exist."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if not removed:
             return Response(
                 {"error": "The recipe is not found in favorites."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        RecipeViewSet.__list_changed(list_model, [recipe_id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def __list_changed(
+        list_model: Type[models.Model], recipe_ids: List[int]
+    ) -> None:
+        """
+        Invalidate what a change of a user's list affects once it is
+        committed: the counts cached over the list table and, for
+        favorites, the cached responses showing the recipes'
+        `favorites_count`.
+
+        Args:
+            list_model:
+                The model class for the list (Favorite or ShoppingCart).
+            recipe_ids:
+                The recipes added to or removed from the list.
+        """
+
+        table = list_model._meta.db_table
+        transaction.on_commit(lambda: bump_version(table))
+        if list_model is Favorite:
+            bump_recipe_versions(recipe_ids)
+
+    @staticmethod
+    def __bulk_list(
+        request: Request, list_model: Type[models.Model]
+    ) -> Response:
+        """
+        Handle adding or removing many recipes to/from
+        a user's favorite or shopping cart list.
+
+        All recipes are added or removed with a single statement. Every
+        distinct requested id gets its own result, in request order:
+        recipes that exist are represented like `FavoriteSerializer`
+        output, with a `status` of `added` or `already_present` (POST),
+        `removed` or `not_present` (DELETE); unknown ids get
+        `not_found`.
+
+        Args:
+            request:
+                The incoming HTTP request, with the recipe `ids`.
+            list_model:
+                The model class for the list (Favorite or ShoppingCart).
+
+        Returns:
+            The HTTP response object.
+        """
+
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data["ids"]))
+
+        if request.method == "POST":
+            recipes = {
+                recipe.id: recipe
+                for recipe in list_model.objects.add_many(
+                    request.user.id, recipe_ids
+                )
+            }
+            changed = [pk for pk, recipe in recipes.items() if recipe.added]
+            represented = {
+                item["id"]: item
+                for item in FavoriteSerializer(
+                    recipes.values(), many=True, context={"request": request}
+                ).data
+            }
+            results = [
+                {
+                    **represented[pk],
+                    "status": "added" if recipes[pk].added
+                    else "already_present",
+                }
+                if pk in recipes else {"id": pk, "status": "not_found"}
+                for pk in recipe_ids
+            ]
+        else:
+            removed = list_model.objects.remove_many(
+                request.user.id, recipe_ids
+            )
+            changed = [pk for pk, value in removed.items() if value]
+            results = [
+                {
+                    "id": pk,
+                    "status": "not_found" if pk not in removed
+                    else "removed" if removed[pk] else "not_present",
+                }
+                for pk in recipe_ids
+            ]
+
+        if changed:
+            RecipeViewSet.__list_changed(list_model, changed)
+        return Response(results, status=status.HTTP_200_OK)
 
     @action(
         methods=["POST", "DELETE"],
@@ -220,60 +455,210 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request=request, list_model=ShoppingCart, pk=pk)
 
     @action(
+        methods=["POST", "DELETE"],
         detail=False,
-        methods=["GET"],
-        permission_classes=(IsAuthenticated,)
+        url_path="favorite",
+        url_name="bulk-favorite",
+        permission_classes=(IsAuthenticated,),
     )
-    def download_shopping_cart(self, request: Request) -> HttpResponse:
+    def bulk_favorite(self, request: Request) -> Response:
         """
-        Download a shopping cart as an Excel file.
+        Add or remove many recipes from the user's favorites.
 
         Args:
             request: The incoming HTTP request.
 
         Returns:
-            An HttpResponse containing the Excel file.
+            The HTTP response object.
         """
 
-        shopping_cart_items = ShoppingCart.objects.filter(user=request.user)
-        ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__in_shopping_cart__in=shopping_cart_items
-            )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount_sum=models.Sum("amount"))
+        return self.__bulk_list(request, Favorite)
+
+    @action(
+        methods=["POST", "DELETE"],
+        detail=False,
+        url_path="shopping_cart",
+        url_name="bulk-shopping-cart",
+        permission_classes=(IsAuthenticated,),
+    )
+    def bulk_shopping_cart(self, request: Request) -> Response:
+        """
+        Add or remove many recipes from the user's shopping cart.
+
+        Args:
+            request: The incoming HTTP request.
+
+        Returns:
+            The HTTP response object.
+        """
+
+        return self.__bulk_list(request, ShoppingCart)
+
+    @action(methods=["GET"], detail=True, permission_classes=(AllowAny,))
+    def similar(self, request: Request, pk: int) -> Response:
+        """
+        List the recipes whose ingredients overlap most with a recipe's.
+
+        The number of recipes is the page size of the view's paginator,
+        set by the `limit` query parameter.
+        Each recipe is represented like `FavoriteSerializer` output with
+        the Jaccard `similarity` of the ingredient sets, see
+        `RecipeQuerySet.similar_to`.
+
+        Args:
+            request: The HTTP request object.
+            pk: The primary key of the recipe.
+
+        Returns:
+            The similar recipes, most similar first.
+        """
+
+        recipe = get_object_or_404(Recipe.objects.only("pk"), pk=pk)
+        similar = Recipe.objects.similar_to(
+            recipe.pk, self.paginator.get_page_size(request)
         )
+        recipes = Recipe.objects.defer(
+            "search_vector", "similarity_bands"
+        ).in_bulk([recipe_id for recipe_id, _ in similar])
+        return Response([
+            {
+                **FavoriteSerializer(
+                    recipes[recipe_id], context={"request": request}
+                ).data,
+                "similarity": round(similarity, 4),
+            }
+            for recipe_id, similarity in similar
+            if recipe_id in recipes
+        ])
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(AllowAny,),
+        keyset_fields=None,
+    )
+    def cookable(self, request: Request) -> Response:
+        """
+        List the recipes that can be cooked from the ingredients at hand.
+
+        The query takes repeated `ingredients` ids, an optional `missing`
+        limit on the number of other ingredients needed and optional
+        `tags` slugs. Recipes needing the fewest other ingredients come
+        first, then those using the most ingredients at hand, then the
+        newest. They are found in the in-memory `pantry_index` and
+        paginated by page number. Each recipe is represented like
+        `FavoriteSerializer` output with its `owned` and `missing`
+        ingredient counts. While the index of this worker is being built
+        the response is 503 with a `Retry-After` header.
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Shopping List"
+        Args:
+            request: The HTTP request object.
 
-        headers = ["Ingredient", "Measurement Unit", "Total Amount"]
-        ws.append(headers)
+        Returns:
+            The paginated recipes.
+        """
 
-        for ingredient in ingredients:
-            ws.append(
-                [
-                    ingredient["ingredient__name"],
-                    ingredient["ingredient__measurement_unit"],
-                    ingredient["amount_sum"],
-                ]
+        query = PantrySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        tag_ids = None
+        if query.validated_data.get("tags"):
+            tag_ids = Tag.objects.filter(
+                slug__in=query.validated_data["tags"]
+            ).values_list("id", flat=True)
+        try:
+            matches = pantry_index.search(
+                query.validated_data["ingredients"],
+                query.validated_data.get("missing"),
+                tag_ids,
             )
+        except IndexNotReady:
+            return Response(
+                {"error": "The recipe index is being built."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "10"},
+            )
+        page = self.paginate_queryset(matches)
+        recipes = Recipe.objects.defer(
+            "search_vector", "similarity_bands"
+        ).in_bulk([match.recipe_id for match in page])
+        pantry_index.discard(
+            match.recipe_id for match in page
+            if match.recipe_id not in recipes
+        )
+        return self.get_paginated_response([
+            {
+                **FavoriteSerializer(
+                    recipes[match.recipe_id], context={"request": request}
+                ).data,
+                "owned": match.owned,
+                "missing": match.missing,
+            }
+            for match in page
+            if match.recipe_id in recipes
+        ])
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+        keyset_fields=None,
+    )
+    def feed(self, request: Request) -> Response:
+        """
+        List the newest recipes of the authors the user follows.
 
-        output = BytesIO()
-        wb.save(output)
+        The recipes are read from the user's timeline and paginated by
+        `(pub_date, id)` cursors, see `FeedPagination`.
 
-        current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        Args:
+            request: The HTTP request object.
 
-        response = HttpResponse(
-            output.getvalue(),
-            content_type=(
-                "application/vnd.openxmlformats-officedocument."
-                "spreadsheetml.sheet"
-            ),
-        )
+        Returns:
+            The paginated recipes.
+        """
 
-        response[
-            "Content-Disposition"
-        ] = f"attachment; filename=shopping_lists_{current_time}.xlsx"
-        return response
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListXLSXRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListTextRenderer,
+            ShoppingListJSONRenderer,
+        ),
+    )
+    def download_shopping_cart(self, request: Request) -> HttpResponse:
+        """
+        Download a shopping cart as a file.
+
+        The format is negotiated from `?format=` (xlsx, csv, txt or json)
+        or the Accept header and defaults to an Excel file. The totals are
+        kept up to date in `ShoppingListItem`, read with a server-side
+        cursor and streamed by the selected renderer.
+
+        Args:
+            request: The incoming HTTP request.
+
+        Returns:
+            A streaming HttpResponse containing the file.
+        """
+
+        rows = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .values_list(
+                "ingredient__name", "ingredient__measurement_unit",
+                "total_amount"
+            )
+            .order_by("ingredient__name")
+            .iterator(chunk_size=2000)
+        )
+        current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        return request.accepted_renderer.get_response(
+            rows, f"shopping_lists_{current_time}"
+        )
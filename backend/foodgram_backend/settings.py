@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -73,6 +74,24 @@ DATABASES = {
     }
 }
 
+# Version counters (see foodgram_api.caching) are seen by every gunicorn
+# worker and management command with a shared backend such as Redis;
+# infra/docker-compose sets one up. With the default process-local
+# backend each worker caches for itself, and other workers' writes show
+# up once the cached entries time out.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+if not CACHES['default']['BACKEND'].endswith('RedisCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -107,7 +126,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'foodgram_api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'],
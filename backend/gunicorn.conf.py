@@ -0,0 +1,12 @@
+def post_worker_init(worker):
+    """
+    Start building the pantry index as soon as a worker has loaded the
+    application, instead of on its first `cookable` request, and retry
+    the timeline fan-outs left pending by a previous worker.
+    """
+
+    from foodgram_api.pantry import pantry_index
+    from recipes.signals import fan_out_pending, fan_out_pool
+
+    pantry_index.start()
+    fan_out_pool.submit(fan_out_pending)
@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db.models import QuerySet
+from django.http import HttpRequest
 
+from foodgram_api.admin import AutocompleteFilter, LargeTableAdminMixin
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
 
 
 class RecipeTagInline(admin.TabularInline):
@@ -20,32 +23,44 @@ class RecipeIngredientInline(admin.TabularInline):
 
     model = RecipeIngredient
     extra = 10
+    autocomplete_fields = ["ingredient"]
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        return super().get_queryset(request).select_related("ingredient")
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin interface for Recipe model.
     """
 
-    list_display = ["id", "name", "author", "favorites_count"]
-    search_fields = ["name", "author__username", "tags__name"]
-    list_filter = ["tags", "author", "pub_date"]
+    list_display = [
+        "id", "name", "author", "favorites_count", "in_carts_count"
+    ]
+    list_select_related = ["author"]
+    search_fields = ["name", "author__username"]
+    list_filter = [
+        "tags", AutocompleteFilter.for_field("author"), "pub_date"
+    ]
+    autocomplete_fields = ["author"]
     inlines = [RecipeIngredientInline, RecipeTagInline]
 
-    def favorites_count(self, obj: Recipe) -> int:
+    def save_related(self, request, form, formsets, change):
         """
-        Returns the count of favorites for a recipe.
-
-        Args:
-            obj (Recipe): Recipe instance.
-
-        Returns:
-            int: Count of favorites.
+        Save the inlines, then refresh the recipe search vector, the
+        similarity buckets, the tag mask and the shopping lists of carts
+        holding the recipe.
         """
-        return obj.favorites.count()
 
-    favorites_count.short_description = "Favorites Count"
+        ShoppingListItem.objects.lock_recipe(form.instance.pk)
+        old_amounts = ShoppingListItem.objects.recipe_amounts(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        recipes = Recipe.objects.filter(pk=form.instance.pk)
+        recipes.update_search_vector()
+        recipes.update_similarity_bands()
+        recipes.update_tags_mask()
+        ShoppingListItem.objects.update_recipe(form.instance.pk, old_amounts)
 
 
 @admin.register(Tag)
@@ -58,7 +73,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin interface for Ingredient model.
     """
@@ -68,20 +83,30 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin interface for Favorite model.
     """
 
     list_display = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    list_filter = (
+        AutocompleteFilter.for_field("user"),
+        AutocompleteFilter.for_field("recipe"),
+    )
+    autocomplete_fields = ("user", "recipe")
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin interface for ShoppingCart model.
     """
 
     list_display = ("user", "recipe", "added_at")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    list_filter = (
+        AutocompleteFilter.for_field("user"),
+        AutocompleteFilter.for_field("recipe"),
+    )
+    autocomplete_fields = ("user", "recipe")
@@ -0,0 +1,93 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import Dict, Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from PIL import Image, ImageOps
+
+DERIVATIVE_SIZES = {
+    "small": 160,
+    "card": 480,
+    "full": 1200,
+}
+WEBP_QUALITY = 80
+WEBP_METHOD = 2
+
+
+def derivative_name(name: str, size: str) -> str:
+    """
+    Build the storage name of an image derivative.
+
+    Derivatives are stored next to the original, e.g.
+    `recipes/<uuid>.png` becomes `recipes/<uuid>.card.webp`.
+
+    Args:
+        name (str): The storage name of the original image.
+        size (str): One of `DERIVATIVE_SIZES`.
+
+    Returns:
+        str: The storage name of the derivative.
+    """
+
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{size}.webp"))
+
+
+def generate_derivatives(
+    name: str, storage: Optional[Storage] = None, force: bool = False
+) -> Dict[str, str]:
+    """
+    Create the WebP derivatives of an image.
+
+    Every derivative fits into a square of its size and is never larger
+    than the original. JPEGs are decoded at the smallest scale that still
+    covers the largest size, and sizes are produced largest first, each
+    resized from the previous one. Existing derivatives are kept unless
+    `force` is set.
+
+    Args:
+        name (str): The storage name of the original image.
+        storage (Storage, optional): The storage holding the image.
+            Defaults to the default storage.
+        force (bool): Whether to regenerate existing derivatives.
+
+    Returns:
+        Dict[str, str]: The storage names of the derivatives by size, as
+            returned by the storage when they are saved.
+
+    Raises:
+        OSError: If the original is missing or is not a valid image.
+    """
+
+    storage = storage or default_storage
+    derivatives = {
+        size: derivative_name(name, size) for size in DERIVATIVE_SIZES
+    }
+    missing = [
+        size for size, path in derivatives.items()
+        if force or not storage.exists(path)
+    ]
+    if not missing:
+        return derivatives
+    largest = max(DERIVATIVE_SIZES[size] for size in missing)
+    with storage.open(name, "rb") as file:
+        image = Image.open(file)
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    for size in sorted(missing, key=DERIVATIVE_SIZES.get, reverse=True):
+        image.thumbnail(
+            (DERIVATIVE_SIZES[size], DERIVATIVE_SIZES[size]),
+            Image.Resampling.LANCZOS,
+        )
+        output = BytesIO()
+        image.save(
+            output, "WEBP", quality=WEBP_QUALITY, method=WEBP_METHOD
+        )
+        if storage.exists(derivatives[size]):
+            storage.delete(derivatives[size])
+        derivatives[size] = storage.save(
+            derivatives[size], ContentFile(output.getvalue())
+        )
+    return derivatives
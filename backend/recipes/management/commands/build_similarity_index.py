@@ -0,0 +1,83 @@
+import csv
+import io
+import time
+from itertools import groupby, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.similarity import similarity_bands
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes the LSH band buckets used to find similar recipes "
+        "from the recipe ingredients"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only index recipes that have no buckets yet",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Recipes written to the database per round trip",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("build_similarity_index requires PostgreSQL")
+        started = time.monotonic()
+        items = RecipeIngredient.objects.order_by("recipe_id")
+        if options["missing_only"]:
+            items = items.filter(recipe__similarity_bands=[])
+        recipes = (
+            (recipe_id, similarity_bands(pk for _, pk in rows))
+            for recipe_id, rows in groupby(
+                items.values_list("recipe_id", "ingredient_id")
+                .iterator(chunk_size=10000),
+                key=lambda row: row[0],
+            )
+        )
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE similarity_staging "
+                "(id bigint, bands bigint[]) ON COMMIT DROP"
+            )
+            while True:
+                batch = list(islice(recipes, options["batch_size"]))
+                if not batch:
+                    break
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for recipe_id, bands in batch:
+                    writer.writerow(
+                        [recipe_id, "{" + ",".join(map(str, bands)) + "}"]
+                    )
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY similarity_staging FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+                total += len(batch)
+                if options["verbosity"]:
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"{total} recipes indexed, "
+                        f"{total / elapsed:.0f} recipes/s"
+                    )
+            cursor.execute(
+                f"UPDATE {Recipe._meta.db_table} AS recipe "
+                "SET similarity_bands = staging.bands "
+                "FROM similarity_staging AS staging "
+                "WHERE staging.id = recipe.id"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total} recipes in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import DERIVATIVE_SIZES, derivative_name
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Removes recipe image files that no recipe references"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=3600,
+            help="Keep files modified within this many seconds",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the files that would be removed",
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field("image")
+        referenced = set()
+        rows = Recipe.objects.values_list("image", "image_derivatives")
+        for image, derivatives in rows.iterator(chunk_size=5000):
+            if image:
+                referenced.add(image)
+                referenced.update(
+                    derivative_name(image, size) for size in DERIVATIVE_SIZES
+                )
+            referenced.update((derivatives or {}).values())
+
+        location = field.storage.location
+        cutoff = time.time() - options["grace"]
+        removed = freed = 0
+        for directory, _, files in os.walk(field.storage.path(field.upload_to)):
+            for file in files:
+                path = os.path.join(directory, file)
+                name = os.path.relpath(path, location).replace(os.sep, "/")
+                if name in referenced:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                if not options["dry_run"]:
+                    os.remove(path)
+                removed += 1
+                freed += stat.st_size
+
+        action = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {removed} unreferenced files, "
+            f"{freed / 1024 / 1024:.1f} MiB"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Fans out to the timelines the recipes whose fan-out was lost or "
+        "failed"
+    )
+
+    def handle(self, *args, **options):
+        count = TimelineEntry.objects.fan_out_pending()
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully fanned out {count} pending recipes"
+        ))
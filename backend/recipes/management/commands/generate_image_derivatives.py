@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from foodgram_api.signals import bump_recipe_versions
+from recipes.images import generate_derivatives
+from recipes.models import Recipe
+
+BUMP_BATCH_SIZE = 1000
+
+
+def process_image(name, force):
+    try:
+        return name, generate_derivatives(name, force=force), None
+    except OSError as error:
+        return name, None, str(error)
+
+
+class Command(BaseCommand):
+    help = "Generates the WebP derivatives of recipe images in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate derivatives that already exist",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        names = sorted({
+            image
+            for image, derivatives in Recipe.objects.exclude(
+                image=""
+            ).values_list("image", "image_derivatives")
+            if force or (derivatives or {}).get("source") != image
+        })
+        if not names:
+            self.stdout.write(self.style.SUCCESS("All images are processed"))
+            return
+        connections.close_all()
+        processed = failed = 0
+        updated = []
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = [
+                pool.submit(process_image, name, force) for name in names
+            ]
+            for future in as_completed(futures):
+                name, derivatives, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                recipes = Recipe.objects.filter(image=name)
+                updated += recipes.values_list("pk", flat=True)
+                recipes.update(
+                    image_derivatives={"source": name, **derivatives}
+                )
+                processed += 1
+        for start in range(0, len(updated), BUMP_BATCH_SIZE):
+            bump_recipe_versions(updated[start:start + BUMP_BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} images, {failed} failed"
+        ))
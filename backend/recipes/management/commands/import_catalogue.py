@@ -0,0 +1,297 @@
+import csv
+import io
+import json
+import re
+import time
+from itertools import chain, islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from foodgram_api.caching import CATALOGUE, bump_version
+from recipes.models import Ingredient, Tag
+
+CATALOGUES = {
+    "ingredient": (Ingredient, ("name", "measurement_unit"), "name"),
+    "tag": (Tag, ("name", "color", "slug"), "slug"),
+}
+JSON_SEPARATOR = re.compile(r"[\s,]*")
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Yield the items of a JSON array without loading the whole file.
+
+    Args:
+        file: The text file holding the array.
+        chunk_size (int): The number of characters read at a time.
+
+    Returns:
+        Iterator: The decoded items, in order.
+
+    Raises:
+        CommandError: If the input is not a well-formed JSON array.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("The JSON input must be an array")
+    position = 1
+    eof = False
+    while True:
+        position = JSON_SEPARATOR.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError("The JSON input is malformed")
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports ingredients or tags from CSV, a JSON array or a fixture, "
+        "creating missing rows and updating changed ones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The CSV or JSON file to import")
+        parser.add_argument(
+            "--model",
+            choices=sorted(CATALOGUES),
+            help=(
+                "What the file holds; taken from fixture entries when "
+                "omitted, ingredients otherwise"
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Rows copied to the database per round trip",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("import_catalogue requires PostgreSQL")
+        self.verbosity = options["verbosity"]
+        self.started = time.monotonic()
+        with open(options["path"], encoding="utf-8", newline="") as file:
+            model, rows = self.read_rows(
+                file, options["path"], options["model"]
+            )
+            with transaction.atomic():
+                inserted, updated, skipped = self.import_rows(
+                    model, rows, options["batch_size"]
+                )
+                if model == "tag":
+                    # The upsert bypasses Tag.save(), which picks mask bits.
+                    try:
+                        Tag.objects.assign_bits()
+                    except ValidationError as error:
+                        raise CommandError(error.messages[0])
+        bump_version(CATALOGUE)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {model}s in {time.monotonic() - self.started:.1f}s: "
+            f"{inserted} created, {updated} updated, "
+            f"{skipped} invalid rows skipped"
+        ))
+
+    def read_rows(self, file, path, model):
+        """
+        Detect the catalogue and iterate the rows of the file.
+
+        Args:
+            file: The open CSV or JSON file.
+            path (str): The path of the file, whose extension tells the
+                format.
+            model (Optional[str]): The catalogue given on the command
+                line, if any.
+
+        Returns:
+            Tuple[str, Iterator]: The catalogue and its rows. Rows are
+                tuples of field values, or None for unreadable items.
+
+        Raises:
+            CommandError: If a fixture holds an unsupported model.
+        """
+
+        if not path.lower().endswith(".json"):
+            return model or "ingredient", csv.reader(file)
+        items = iter_json_array(file)
+        first = next(items, None)
+        if model is None:
+            label = "recipes.ingredient"
+            if isinstance(first, dict):
+                label = first.get("model", label)
+            model = label.rpartition(".")[2]
+            if model not in CATALOGUES:
+                raise CommandError(f"Unsupported fixture model: {label}")
+        fields = CATALOGUES[model][1]
+        items = chain([first] if first is not None else [], items)
+        return model, (self.json_row(item, fields) for item in items)
+
+    def json_row(self, item, fields):
+        """
+        Read the field values of a JSON object or fixture entry.
+
+        Args:
+            item: The decoded JSON item.
+            fields (Tuple[str, ...]): The fields to read.
+
+        Returns:
+            Optional[tuple]: The values of the fields, missing ones as
+                None, or None if the item is not an object.
+        """
+
+        if isinstance(item, dict):
+            item = item.get("fields", item)
+        if not isinstance(item, dict):
+            return None
+        return tuple(item.get(field) for field in fields)
+
+    def import_rows(self, model, rows, batch_size):
+        """
+        Copy the rows into a staging table and upsert them.
+
+        Args:
+            model (str): The catalogue.
+            rows (Iterator): The rows, as returned by `read_rows`.
+            batch_size (int): The number of rows copied per round trip.
+
+        Returns:
+            Tuple[int, int, int]: The numbers of rows created, of rows
+                updated and of invalid rows skipped.
+
+        Raises:
+            CommandError: If the import would give two rows the same
+                value of a unique field.
+        """
+
+        model, fields, key_field = CATALOGUES[model]
+        unique = [
+            field for field in fields
+            if field != key_field and model._meta.get_field(field).unique
+        ]
+        max_lengths = [
+            model._meta.get_field(field).max_length for field in fields
+        ]
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ", ".join(quote(field) for field in fields)
+        key = quote(key_field)
+        changed = [quote(field) for field in fields if quote(field) != key]
+        assignments = ", ".join(
+            f"{column} = EXCLUDED.{column}" for column in changed
+        )
+        current = ", ".join(f"{table}.{column}" for column in changed)
+        incoming = ", ".join(f"EXCLUDED.{column}" for column in changed)
+        total = skipped = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE catalogue_staging ("
+                "position bigint GENERATED ALWAYS AS IDENTITY, "
+                + ", ".join(f"{quote(field)} text" for field in fields)
+                + ") ON COMMIT DROP"
+            )
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in batch:
+                    if row is None or len(row) != len(fields) or not all(
+                        isinstance(value, str)
+                        and 0 < len(value.strip()) <= max_length
+                        for value, max_length in zip(row, max_lengths)
+                    ):
+                        skipped += 1
+                        continue
+                    writer.writerow(value.strip() for value in row)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY catalogue_staging ({columns}) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+                total += len(batch)
+                if self.verbosity:
+                    elapsed = time.monotonic() - self.started
+                    self.stdout.write(
+                        f"{total} rows read, {total / elapsed:.0f} rows/s"
+                    )
+            for field in unique:
+                self.check_conflicts(cursor, model, key_field, field)
+            # DISTINCT ON keeps the first occurrence of a key, as a single
+            # INSERT ... ON CONFLICT cannot touch the same row twice.
+            # Unchanged rows are not rewritten, so re-imports are no-ops.
+            cursor.execute(
+                f"WITH upserted AS ("
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT DISTINCT ON ({key}) {columns} "
+                f"FROM catalogue_staging ORDER BY {key}, position "
+                f"ON CONFLICT ({key}) DO UPDATE SET {assignments} "
+                f"WHERE ROW({current}) IS DISTINCT FROM ROW({incoming}) "
+                f"RETURNING xmax = 0 AS inserted) "
+                f"SELECT count(*) FILTER (WHERE inserted), "
+                f"count(*) FILTER (WHERE NOT inserted) FROM upserted"
+            )
+            inserted, updated = cursor.fetchone()
+        return inserted, updated, skipped
+
+    def check_conflicts(self, cursor, model, key, field):
+        """
+        Make sure the upsert keeps a unique column unique.
+
+        The upsert only resolves conflicts on the key, so a value of
+        another unique field held by a row with a different key would
+        abort it with an IntegrityError. As uniqueness is checked row by
+        row, a value freed by the same import counts as held, so moving
+        a value between keys takes two imports.
+
+        Args:
+            cursor: The cursor holding the staging table.
+            model: The catalogue model.
+            key (str): The key field.
+            field (str): The unique field.
+
+        Raises:
+            CommandError: If rows with different keys would share a value.
+        """
+
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        column = quote(field)
+        key_column = quote(key)
+        cursor.execute(
+            f"WITH incoming AS ("
+            f"SELECT DISTINCT ON ({key_column}) {key_column}, {column} "
+            f"FROM catalogue_staging ORDER BY {key_column}, position), "
+            f"merged AS ("
+            f"SELECT {key_column}, {column} FROM incoming UNION ALL "
+            f"SELECT {key_column}, {column} FROM {table} AS existing "
+            f"WHERE NOT EXISTS (SELECT FROM incoming "
+            f"WHERE incoming.{key_column} = existing.{key_column} "
+            f"AND incoming.{column} = existing.{column})) "
+            f"SELECT {column}, "
+            f"string_agg({key_column}, ', ' ORDER BY {key_column}) "
+            f"FROM merged GROUP BY {column} HAVING count(*) > 1 "
+            f"ORDER BY {column} LIMIT 1"
+        )
+        conflict = cursor.fetchone()
+        if conflict is not None:
+            value, keys = conflict
+            raise CommandError(
+                f"The rows with {key} {keys} would share the {field} "
+                f"{value!r}"
+            )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Rebuilds per-user shopping list totals and verifies them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Only compare the stored totals with the shopping carts",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify_only"]:
+            with transaction.atomic():
+                ShoppingListItem.objects.rebuild()
+            self.stdout.write(
+                self.style.SUCCESS("Successfully rebuilt shopping lists")
+            )
+        mismatches = ShoppingListItem.objects.count_mismatches()
+        if mismatches:
+            raise CommandError(
+                f"{mismatches} shopping list totals do not match the carts"
+            )
+        self.stdout.write(
+            self.style.SUCCESS("Shopping list totals match the carts")
+        )
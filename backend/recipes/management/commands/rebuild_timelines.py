@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-user timelines of the recipe feed"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully rebuilt timelines: "
+            f"{TimelineEntry.objects.count()} entries"
+        ))
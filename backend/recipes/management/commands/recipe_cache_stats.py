@@ -0,0 +1,37 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_api.caching import anonymous_cache_stats, cache_is_shared
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the hit and miss counters of the anonymous recipe cache, "
+        "kept in the shared cache by all workers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters after printing them",
+        )
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                "The counters live in the workers' caches; configure a "
+                "shared cache backend (CACHE_BACKEND) to read them"
+            )
+        hits, misses = anonymous_cache_stats("recipes")
+        total = hits + misses
+        ratio = hits / total if total else 0
+        self.stdout.write(
+            f"hits: {hits}, misses: {misses}, hit ratio: {ratio:.1%}"
+        )
+        if options["reset"]:
+            cache.delete_many([
+                "recipes:anonymous-cache:hits",
+                "recipes:anonymous-cache:misses",
+            ])
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
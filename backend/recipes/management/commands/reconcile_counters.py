@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodgram_api.counters import COUNTERS
+
+
+class Command(BaseCommand):
+    help = "Recounts the stored favorite, cart, recipe and follower counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many stored counts are wrong",
+        )
+
+    def handle(self, *args, **options):
+        action = "wrong" if options["dry_run"] else "fixed"
+        for counter in COUNTERS:
+            with transaction.atomic():
+                drifted = counter.reconcile(dry_run=options["dry_run"])
+            self.stdout.write(self.style.SUCCESS(
+                f"{counter.holder._meta.verbose_name}.{counter.field}: "
+                f"{drifted} {action}"
+            ))
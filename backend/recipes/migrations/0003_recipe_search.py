@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:25
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+UPDATE_SEARCH_VECTOR = """
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', recipe.name), 'A')
+    || setweight(to_tsvector('english', recipe.name), 'A')
+    || setweight(to_tsvector('russian', ingredients.names), 'B')
+    || setweight(to_tsvector('english', ingredients.names), 'B')
+    || setweight(to_tsvector('russian', recipe.text), 'C')
+    || setweight(to_tsvector('english', recipe.text), 'C')
+FROM (
+    SELECT recipe.id, COALESCE(string_agg(ingredient.name, ' '), '') AS names
+    FROM recipes_recipe AS recipe
+    LEFT JOIN recipes_recipeingredient AS item ON item.recipe_id = recipe.id
+    LEFT JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = item.ingredient_id
+    GROUP BY recipe.id
+) AS ingredients
+WHERE ingredients.id = recipe.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_alter_tag_options'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Search Vector'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='recipe_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(UPDATE_SEARCH_VECTOR, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+POPULATE_SHOPPING_LISTS = """
+INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+FROM recipes_shoppingcart AS cart
+JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+GROUP BY cart.user_id, item.ingredient_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Total Amount')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_lists', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Shopping List Item',
+                'verbose_name_plural': 'Shopping List Items',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_ingredient'),
+        ),
+        migrations.RunSQL(POPULATE_SHOPPING_LISTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('-pub_date', '-id'), 'verbose_name': 'Recipe', 'verbose_name_plural': 'Recipes'},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+    ]
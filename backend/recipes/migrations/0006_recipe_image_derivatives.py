@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image Derivatives'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:44
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='Image'),
+        ),
+    ]
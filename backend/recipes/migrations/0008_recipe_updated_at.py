@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Last Updated'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(
+            'UPDATE recipes_recipe SET updated_at = pub_date',
+            migrations.RunSQL.noop,
+        ),
+    ]
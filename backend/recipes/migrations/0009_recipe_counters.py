@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Favorites Count'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Shopping Carts Count'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE recipes_recipe SET
+                favorites_count = (
+                    SELECT COUNT(*) FROM recipes_favorite
+                    WHERE recipe_id = recipes_recipe.id
+                ),
+                in_carts_count = (
+                    SELECT COUNT(*) FROM recipes_shoppingcart
+                    WHERE recipe_id = recipes_recipe.id
+                )
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
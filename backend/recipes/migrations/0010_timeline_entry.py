@@ -0,0 +1,69 @@
+# Generated by Django 4.2.6 on 2026-10-17 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_counters'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Publication Date')),
+            ],
+            options={
+                'verbose_name': 'Timeline Entry',
+                'verbose_name_plural': 'Timeline Entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Author'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Recipe'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Reader'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'pub_date', 'recipe'), name='timeline_entry_unique'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO recipes_timelineentry
+                (user_id, recipe_id, author_id, pub_date)
+            SELECT subscription.user_id, recipe.id, recipe.author_id,
+                recipe.pub_date
+            FROM recipes_recipe AS recipe
+            JOIN users_customuser AS author ON author.id = recipe.author_id
+            JOIN users_subscription AS subscription
+                ON subscription.author_id = recipe.author_id
+            WHERE author.followers_count <= 10000
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.6 on 2026-10-17 07:12
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timeline_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='similarity_bands',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None, verbose_name='Similarity Bands'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['similarity_bands'], name='recipe_similarity_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.6 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Mask Bit'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Tags Mask'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE recipes_tag SET bit = numbered.bit
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS bit
+                FROM recipes_tag
+            ) AS numbered
+            WHERE numbered.id = recipes_tag.id AND numbered.bit < 63
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE recipes_recipe SET tags_mask = masks.mask
+            FROM (
+                SELECT recipe_tag.recipe_id,
+                       BIT_OR(1::bigint << tag.bit) AS mask
+                FROM recipes_recipetag AS recipe_tag
+                JOIN recipes_tag AS tag ON tag.id = recipe_tag.tag_id
+                WHERE tag.bit IS NOT NULL
+                GROUP BY recipe_tag.recipe_id
+            ) AS masks
+            WHERE masks.recipe_id = recipes_recipe.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['tags_mask'], name='recipe_tags_mask_idx'),
+        ),
+    ]
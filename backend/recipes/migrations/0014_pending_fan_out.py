@@ -0,0 +1,25 @@
+# Generated by Django 4.2.6 on 2026-10-17 09:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFanOut',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe', verbose_name='Recipe')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Pending Fan-Out',
+                'verbose_name_plural': 'Pending Fan-Outs',
+            },
+        ),
+    ]
@@ -1,10 +1,111 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.contrib.postgres.aggregates import BitOr, StringAgg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField,
+                                            TrigramSimilarity)
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, UniqueConstraint, Value
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 
+from recipes.similarity import similarity_bands
+from recipes.storage import recipe_image_storage
+from users.models import Subscription
+
 User = get_user_model()
 
+SEARCH_CONFIGS = ("russian", "english")
+
+MAX_TAGS = 63
+MAX_LISTED_TAG_BITS = 10
+
+SIMILAR_RECIPES = """
+    WITH candidates AS (
+        SELECT match.id, COUNT(*) AS shared_bands
+        FROM {recipes} AS target
+        CROSS JOIN unnest(target.similarity_bands) AS bucket
+        CROSS JOIN LATERAL (
+            SELECT recipe.id FROM {recipes} AS recipe
+            WHERE recipe.similarity_bands @> ARRAY[bucket]
+            AND recipe.id <> target.id
+            LIMIT %(bucket_size)s
+        ) AS match
+        WHERE target.id = %(id)s
+        GROUP BY match.id
+        ORDER BY shared_bands DESC, match.id
+        LIMIT %(candidates)s
+    )
+    , overlap AS (
+        SELECT
+            candidate.id,
+            COUNT(DISTINCT item.ingredient_id) FILTER (
+                WHERE item.ingredient_id IN (
+                    SELECT ingredient_id FROM {recipe_ingredients}
+                    WHERE recipe_id = %(id)s
+                )
+            ) AS shared,
+            COUNT(DISTINCT item.ingredient_id) AS total
+        FROM candidates AS candidate
+        JOIN {recipe_ingredients} AS item ON item.recipe_id = candidate.id
+        GROUP BY candidate.id
+    )
+    SELECT id, shared::float / (
+        total + (
+            SELECT COUNT(DISTINCT ingredient_id) FROM {recipe_ingredients}
+            WHERE recipe_id = %(id)s
+        ) - shared
+    ) AS similarity
+    FROM overlap
+    WHERE shared > 0
+    ORDER BY similarity DESC, id
+    LIMIT %(limit)s
+"""
+
+
+class TagManager(models.Manager):
+    def free_bits(self, count: int) -> List[int]:
+        """
+        Pick the lowest mask bits no tag holds, see `Tag.bit`.
+
+        Args:
+            count (int): The number of bits needed.
+
+        Returns:
+            List[int]: The bits.
+
+        Raises:
+            ValidationError: If fewer than `count` bits are free.
+        """
+
+        used = set(self.exclude(bit=None).values_list("bit", flat=True))
+        free = [bit for bit in range(MAX_TAGS) if bit not in used][:count]
+        if len(free) < count:
+            raise ValidationError(
+                f"There can be at most {MAX_TAGS} tags."
+            )
+        return free
+
+    def assign_bits(self) -> int:
+        """
+        Give a mask bit to every tag that has none, such as tags
+        inserted by `import_catalogue`.
+
+        Returns:
+            int: The number of tags updated.
+        """
+
+        tags = list(self.filter(bit=None).order_by("pk"))
+        for tag, bit in zip(tags, self.free_bits(len(tags))):
+            tag.bit = bit
+        return self.bulk_update(tags, ["bit"])
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -17,6 +118,11 @@ class Tag(models.Model):
         max_length=200, unique=True, verbose_name="Slug",
         help_text="Enter slug", db_index=True
     )
+    bit = models.PositiveSmallIntegerField(
+        null=True, unique=True, editable=False, verbose_name="Mask Bit"
+    )
+
+    objects = TagManager()
 
     class Meta:
         ordering = ("id",)
@@ -26,6 +132,69 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        """
+        Check that a new tag can get a mask bit before it is saved.
+
+        Raises:
+            ValidationError: If all mask bits are taken.
+        """
+
+        if self.bit is None:
+            Tag.objects.free_bits(1)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the tag, giving a new tag the lowest free mask bit.
+        """
+
+        if self.bit is None:
+            self.bit = Tag.objects.free_bits(1)[0]
+        super().save(*args, **kwargs)
+
+
+def tags_mask_of(tags: Iterable[Tag]) -> int:
+    """
+    Combine the mask bits of tags into a `Recipe.tags_mask` value.
+
+    Args:
+        tags (Iterable[Tag]): The tags.
+
+    Returns:
+        int: The mask.
+    """
+
+    mask = 0
+    for tag in tags:
+        if tag.bit is not None:
+            mask |= 1 << tag.bit
+    return mask
+
+
+def matching_tag_masks(
+    mask: int, universe: int, match_all: bool = False
+) -> List[int]:
+    """
+    List the tag masks that match a tag filter.
+
+    Args:
+        mask (int): The mask of the requested tags.
+        universe (int): The mask of all tags.
+        match_all (bool): Whether every requested tag is needed rather
+            than any of them.
+
+    Returns:
+        List[int]: Every subset of `universe` that matches.
+    """
+
+    masks = []
+    subset = universe
+    while subset:
+        if (subset & mask == mask) if match_all else (subset & mask):
+            masks.append(subset)
+        subset = (subset - 1) & universe
+    return masks
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -43,6 +212,194 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def update_search_vector(self) -> int:
+        """
+        Recompute the stored full-text vector of the recipes.
+
+        The vector holds the name, ingredient names and description with
+        decreasing weights, parsed with every configuration in
+        `SEARCH_CONFIGS`.
+
+        Returns:
+            int: The number of updated recipes.
+        """
+
+        ingredient_names = (
+            RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(names=StringAgg("ingredient__name", " "))
+            .values("names")
+        )
+        sources = (
+            ("name", "A"),
+            (
+                Coalesce(
+                    Subquery(ingredient_names), Value(""),
+                    output_field=models.TextField()
+                ),
+                "B",
+            ),
+            ("text", "C"),
+        )
+        vector = None
+        for source, weight in sources:
+            for config in SEARCH_CONFIGS:
+                part = SearchVector(source, config=config, weight=weight)
+                vector = part if vector is None else vector + part
+        return self.update(search_vector=vector)
+
+    def update_similarity_bands(self) -> int:
+        """
+        Recompute the stored LSH band buckets of the recipes from their
+        ingredients, see `recipes.similarity`.
+
+        Returns:
+            int: The number of updated recipes.
+        """
+
+        ingredients = {pk: [] for pk in self.values_list("pk", flat=True)}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=list(ingredients)
+        ).values_list("recipe_id", "ingredient_id"):
+            ingredients[recipe_id].append(ingredient_id)
+        recipes = [
+            Recipe(pk=pk, similarity_bands=similarity_bands(ingredient_ids))
+            for pk, ingredient_ids in ingredients.items()
+        ]
+        return Recipe.objects.bulk_update(
+            recipes, ["similarity_bands"], batch_size=1000
+        )
+
+    def update_tags_mask(self) -> int:
+        """
+        Recompute the stored tag bitmask of the recipes, see `Tag.bit`.
+
+        Returns:
+            int: The number of updated recipes.
+        """
+
+        masks = (
+            RecipeTag.objects.filter(
+                recipe=OuterRef("pk"), tag__bit__isnull=False
+            )
+            .order_by()
+            .values("recipe")
+            .annotate(
+                mask=BitOr(
+                    Cast(Value(1), models.BigIntegerField())
+                    .bitleftshift(F("tag__bit"))
+                )
+            )
+            .values("mask")
+        )
+        return self.update(
+            tags_mask=Coalesce(
+                Subquery(masks), Value(0),
+                output_field=models.BigIntegerField()
+            )
+        )
+
+    def with_tags(
+        self, mask: int, universe: int, match_all: bool = False
+    ) -> "RecipeQuerySet":
+        """
+        Filter the recipes by tags through the stored bitmask, without
+        joining the tag tables.
+
+        With few tags the accepted masks are listed so that the filter
+        is an index lookup, otherwise the mask is tested bit by bit.
+
+        Args:
+            mask (int): The mask of the requested tags.
+            universe (int): The mask of all tags.
+            match_all (bool): Whether every requested tag is needed rather
+                than any of them.
+
+        Returns:
+            RecipeQuerySet: The filtered recipes.
+        """
+
+        if bin(universe).count("1") <= MAX_LISTED_TAG_BITS:
+            return self.filter(
+                tags_mask__in=matching_tag_masks(mask, universe, match_all)
+            )
+        queryset = self.alias(matched_tags=F("tags_mask").bitand(mask))
+        if match_all:
+            return queryset.filter(matched_tags=mask)
+        return queryset.exclude(matched_tags=0)
+
+    def similar_to(
+        self, recipe_id: int, limit: int, candidates: int = 200,
+        bucket_size: int = 100
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the recipes whose ingredients overlap most with a recipe's.
+
+        Candidates are the recipes sharing an LSH bucket with the recipe,
+        found through the GIN index of `similarity_bands`, so the other
+        recipes are never read. At most `candidates` of them, those
+        sharing the most buckets, are ranked by the exact Jaccard
+        similarity of their ingredient sets.
+
+        Args:
+            recipe_id (int): The recipe.
+            limit (int): The largest number of recipes to return.
+            candidates (int): The largest number of candidates ranked.
+            bucket_size (int): The largest number of recipes read from
+                each bucket, which bounds the cost of crowded buckets.
+
+        Returns:
+            List[Tuple[int, float]]:
+                The ids and similarities of the recipes, most similar
+                first.
+        """
+
+        sql = SIMILAR_RECIPES.format(
+            recipes=Recipe._meta.db_table,
+            recipe_ingredients=RecipeIngredient._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                {
+                    "id": recipe_id,
+                    "limit": limit,
+                    "candidates": candidates,
+                    "bucket_size": bucket_size,
+                },
+            )
+            return cursor.fetchall()
+
+    def search(self, text: str) -> "RecipeQuerySet":
+        """
+        Filter the recipes by a full-text or fuzzy name match.
+
+        Matches are ranked by full-text rank plus trigram similarity of
+        the name, so that typos in the name still find the recipe.
+
+        Args:
+            text (str): The search text, in web search syntax.
+
+        Returns:
+            RecipeQuerySet: The matching recipes, best matches first.
+        """
+
+        query = None
+        for config in SEARCH_CONFIGS:
+            part = SearchQuery(text, config=config, search_type="websearch")
+            query = part if query is None else query | part
+        return (
+            self.filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+            .annotate(
+                search_rank=SearchRank(F("search_vector"), query)
+                + TrigramSimilarity("name", text)
+            )
+            .order_by("-search_rank", "-pub_date")
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="Author",
@@ -56,7 +413,8 @@ class Recipe(models.Model):
         Tag, through="RecipeTag", verbose_name="Tags", related_name="tags"
     )
     image = models.ImageField(
-        upload_to="recipes/", verbose_name="Image"
+        upload_to="recipes/", storage=recipe_image_storage,
+        verbose_name="Image"
     )
     text = models.TextField(verbose_name="Description")
     cooking_time = models.PositiveSmallIntegerField(
@@ -66,11 +424,55 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name="Publication Date"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name="Last Updated"
+    )
+    image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name="Image Derivatives"
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name="Search Vector"
+    )
+    similarity_bands = ArrayField(
+        models.BigIntegerField(), default=list, editable=False,
+        verbose_name="Similarity Bands"
+    )
+    tags_mask = models.BigIntegerField(
+        default=0, editable=False, verbose_name="Tags Mask"
+    )
+    favorites_count = models.IntegerField(
+        default=0, editable=False, verbose_name="Favorites Count"
+    )
+    in_carts_count = models.IntegerField(
+        default=0, editable=False, verbose_name="Shopping Carts Count"
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Recipe"
         verbose_name_plural = "Recipes"
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_date_idx",
+            ),
+            models.Index(fields=["updated_at"], name="recipe_updated_at_idx"),
+            models.Index(fields=["tags_mask"], name="recipe_tags_mask_idx"),
+            GinIndex(fields=["search_vector"], name="recipe_search_idx"),
+            GinIndex(
+                fields=["similarity_bands"], name="recipe_similarity_idx"
+            ),
+            GinIndex(
+                fields=["name"], name="recipe_name_trgm_idx",
+                opclasses=["gin_trgm_ops"]
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -115,6 +517,220 @@ class RecipeIngredient(models.Model):
         )
 
 
+ADD_TO_RECIPE_LIST = """
+    WITH added AS (
+        INSERT INTO {list} ({columns})
+        SELECT %s, id{values} FROM {recipes}
+        WHERE id = ANY(%s)
+        ORDER BY id
+        ON CONFLICT (user_id, recipe_id) DO NOTHING
+        RETURNING recipe_id
+    )
+    , counted AS (
+        UPDATE {recipes} SET {counter} = {counter} + 1
+        WHERE id IN (SELECT recipe_id FROM added)
+    )
+    SELECT recipe.*, recipe.id IN (SELECT recipe_id FROM added) AS added
+    FROM {recipes} AS recipe
+    WHERE recipe.id = ANY(%s)
+"""
+
+REMOVE_FROM_RECIPE_LIST = """
+    WITH removed AS (
+        DELETE FROM {list} WHERE user_id = %s AND recipe_id = ANY(%s)
+        RETURNING recipe_id
+    )
+    , counted AS (
+        UPDATE {recipes} SET {counter} = {counter} - 1
+        WHERE id IN (SELECT recipe_id FROM removed)
+    )
+    SELECT recipe.id, recipe.id IN (SELECT recipe_id FROM removed)
+    FROM {recipes} AS recipe
+    WHERE recipe.id = ANY(%s)
+"""
+
+
+class RecipeListManager(models.Manager):
+    """
+    Adds recipes to and removes them from a per-user list in one
+    statement per request, for one recipe or many.
+
+    The statements rely on the unique (user, recipe) constraint instead
+    of checking first, so concurrent requests for the same pair cannot
+    both succeed. The same statements adjust the recipe counter named by
+    `counter_field`. Model signals are not sent; other side effects of a
+    change are applied by `recipes_added()` and `recipes_removed()`;
+    managers that override them run in a transaction.
+
+    Attributes:
+        counter_field (str): The `Recipe` field counting the list entries.
+    """
+
+    counter_field: str
+
+    def add_many(
+        self, user_id: int, recipe_ids: Iterable[int]
+    ) -> List[Recipe]:
+        """
+        Put recipes on a user's list.
+
+        Args:
+            user_id (int): The list owner.
+            recipe_ids (Iterable[int]): The recipes.
+
+        Returns:
+            List[Recipe]:
+                The recipes that exist, each with an `added` attribute
+                telling whether it was added (False if it was already on
+                the list).
+        """
+
+        auto_now_add = [
+            field for field in self.model._meta.concrete_fields
+            if getattr(field, "auto_now_add", False)
+        ]
+        sql = ADD_TO_RECIPE_LIST.format(
+            list=self.model._meta.db_table,
+            recipes=Recipe._meta.db_table,
+            columns=", ".join(
+                ["user_id", "recipe_id"]
+                + [field.column for field in auto_now_add]
+            ),
+            values="".join(", %s" for _ in auto_now_add),
+            counter=self.counter_field,
+        )
+        recipe_ids = list(recipe_ids)
+        params = [
+            user_id, *(timezone.now() for _ in auto_now_add),
+            recipe_ids, recipe_ids,
+        ]
+        recipes = list(Recipe.objects.raw(sql, params))
+        added = []
+        for recipe in recipes:
+            if recipe.added:
+                added.append(recipe.id)
+                setattr(
+                    recipe, self.counter_field,
+                    getattr(recipe, self.counter_field) + 1
+                )
+        if added:
+            self.recipes_added(user_id, added)
+        return recipes
+
+    def remove_many(
+        self, user_id: int, recipe_ids: Iterable[int]
+    ) -> Dict[int, bool]:
+        """
+        Take recipes off a user's list.
+
+        Args:
+            user_id (int): The list owner.
+            recipe_ids (Iterable[int]): The recipes.
+
+        Returns:
+            Dict[int, bool]:
+                For every recipe that exists, whether it was removed
+                (False if it was not on the list).
+        """
+
+        sql = REMOVE_FROM_RECIPE_LIST.format(
+            list=self.model._meta.db_table,
+            recipes=Recipe._meta.db_table,
+            counter=self.counter_field,
+        )
+        recipe_ids = list(recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, recipe_ids, recipe_ids])
+            removed = dict(cursor.fetchall())
+        if any(removed.values()):
+            self.recipes_removed(
+                user_id, [key for key, value in removed.items() if value]
+            )
+        return removed
+
+    def add(
+        self, user_id: int, recipe_id: int
+    ) -> Tuple[Optional[Recipe], bool]:
+        """
+        Put a recipe on a user's list.
+
+        Args:
+            user_id (int): The list owner.
+            recipe_id (int): The recipe.
+
+        Returns:
+            Tuple[Optional[Recipe], bool]:
+                The recipe, or None if it does not exist, and whether it
+                was added (False if it was already on the list).
+        """
+
+        recipes = self.add_many(user_id, [recipe_id])
+        if not recipes:
+            return None, False
+        return recipes[0], recipes[0].added
+
+    def remove(self, user_id: int, recipe_id: int) -> Tuple[bool, bool]:
+        """
+        Take a recipe off a user's list.
+
+        Args:
+            user_id (int): The list owner.
+            recipe_id (int): The recipe.
+
+        Returns:
+            Tuple[bool, bool]:
+                Whether the recipe exists, and whether it was removed
+                (False if it was not on the list).
+        """
+
+        removed = self.remove_many(user_id, [recipe_id])
+        return recipe_id in removed, removed.get(recipe_id, False)
+
+    def recipes_added(self, user_id: int, recipe_ids: List[int]) -> None:
+        """
+        Apply the side effects of recipes put on a user's list.
+        """
+
+    def recipes_removed(self, user_id: int, recipe_ids: List[int]) -> None:
+        """
+        Apply the side effects of recipes taken off a user's list.
+        """
+
+
+class FavoriteManager(RecipeListManager):
+    """
+    Adds and removes favorites, counted in `Recipe.favorites_count`.
+    """
+
+    counter_field = "favorites_count"
+
+
+class ShoppingCartManager(RecipeListManager):
+    """
+    Keeps the shopping list totals in step with cart changes.
+    """
+
+    counter_field = "in_carts_count"
+
+    @transaction.atomic
+    def add_many(
+        self, user_id: int, recipe_ids: Iterable[int]
+    ) -> List[Recipe]:
+        return super().add_many(user_id, recipe_ids)
+
+    @transaction.atomic
+    def remove_many(
+        self, user_id: int, recipe_ids: Iterable[int]
+    ) -> Dict[int, bool]:
+        return super().remove_many(user_id, recipe_ids)
+
+    def recipes_added(self, user_id: int, recipe_ids: List[int]) -> None:
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids)
+
+    def recipes_removed(self, user_id: int, recipe_ids: List[int]) -> None:
+        ShoppingListItem.objects.remove_recipes(user_id, recipe_ids)
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="User",
@@ -125,6 +741,8 @@ class Favorite(models.Model):
         related_name="favorites"
     )
 
+    objects = FavoriteManager()
+
     class Meta:
         constraints = [
             UniqueConstraint(
@@ -135,7 +753,7 @@ class Favorite(models.Model):
         verbose_name_plural = "Favorites"
 
     def __str__(self):
-        return self.name
+        return f"{self.user.username} - {self.recipe.name}"
 
 
 class ShoppingCart(models.Model):
@@ -147,6 +765,8 @@ class ShoppingCart(models.Model):
     )
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShoppingCartManager()
+
     class Meta:
         verbose_name = "Shopping Cart"
         verbose_name_plural = "Shopping Carts"
@@ -158,3 +778,516 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.name}"
+
+
+EXPECTED_SHOPPING_LISTS = """
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount) AS total_amount
+    FROM {carts} AS cart
+    JOIN {recipe_ingredients} AS item ON item.recipe_id = cart.recipe_id
+    GROUP BY cart.user_id, item.ingredient_id
+"""
+
+REBUILD_SHOPPING_LISTS = """
+    INSERT INTO {items} (user_id, ingredient_id, total_amount) {expected}
+"""
+
+
+class ShoppingListItemManager(models.Manager):
+    """
+    Keeps the per-user shopping list totals in step with shopping carts.
+
+    All changes are applied as single `INSERT ... ON CONFLICT DO UPDATE`
+    statements adding signed amounts to the stored totals, followed by
+    removal of the totals that dropped to zero. Callers are expected to
+    run them in the transaction that changes the cart or the recipe.
+
+    Cart changes read the recipe ingredients under a share lock of the
+    recipe rows, and ingredient changes lock the recipe row with
+    `lock_recipe()` before taking their snapshot, so a cart change never
+    applies amounts that a concurrent ingredient change replaces.
+    """
+
+    def _execute(self, sql: str, params: list) -> Optional[tuple]:
+        """
+        Run a statement with the table names filled in.
+
+        Returns:
+            Optional[tuple]: The first row, if the statement returns rows.
+        """
+
+        tables = {
+            "items": self.model._meta.db_table,
+            "recipe_ingredients": RecipeIngredient._meta.db_table,
+            "carts": ShoppingCart._meta.db_table,
+            "recipes": Recipe._meta.db_table,
+        }
+        tables["expected"] = EXPECTED_SHOPPING_LISTS.format(**tables)
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**tables), params)
+            if cursor.description is not None:
+                return cursor.fetchone()
+        return None
+
+    def _change_recipes(
+        self, user_id: int, recipe_ids: Iterable[int], sign: int
+    ) -> None:
+        """
+        Add (sign 1) or subtract (sign -1) recipes from a user's totals.
+
+        The recipe rows are share-locked by a statement of their own, so
+        the ingredients are read after a concurrent ingredient change of
+        the recipes commits.
+        """
+
+        recipe_ids = list(recipe_ids)
+        self._execute(
+            """
+            SELECT id FROM {recipes} WHERE id = ANY(%s)
+            ORDER BY id FOR SHARE
+            """,
+            [recipe_ids],
+        )
+        self._execute(
+            """
+            INSERT INTO {items} AS item (user_id, ingredient_id, total_amount)
+            SELECT %s, ingredient_id, %s * SUM(amount)
+            FROM {recipe_ingredients}
+            WHERE recipe_id = ANY(%s)
+            GROUP BY ingredient_id
+            ORDER BY ingredient_id
+            ON CONFLICT (user_id, ingredient_id) DO UPDATE
+            SET total_amount = item.total_amount + EXCLUDED.total_amount
+            """,
+            [user_id, sign, recipe_ids],
+        )
+        if sign < 0:
+            self._execute(
+                "DELETE FROM {items} WHERE user_id = %s AND total_amount <= 0",
+                [user_id],
+            )
+
+    def add_recipes(self, user_id: int, recipe_ids: Iterable[int]) -> None:
+        """
+        Add the ingredients of recipes put into a user's cart.
+
+        Args:
+            user_id (int): The cart owner.
+            recipe_ids (Iterable[int]): The recipes added to the cart.
+        """
+
+        self._change_recipes(user_id, recipe_ids, 1)
+
+    def remove_recipes(
+        self, user_id: int, recipe_ids: Iterable[int]
+    ) -> None:
+        """
+        Subtract the ingredients of recipes taken out of a user's cart.
+
+        Args:
+            user_id (int): The cart owner.
+            recipe_ids (Iterable[int]): The recipes removed from the cart.
+        """
+
+        self._change_recipes(user_id, recipe_ids, -1)
+
+    def lock_recipe(self, recipe_id: int) -> None:
+        """
+        Lock a recipe row before changing its ingredients.
+
+        Cart changes of the recipe wait until the change commits, so they
+        apply the new amounts; must be called before `recipe_amounts()`
+        and before any other row is locked by the change.
+
+        Args:
+            recipe_id (int): The recipe.
+        """
+
+        list(
+            Recipe.objects.select_for_update(no_key=True)
+            .filter(pk=recipe_id)
+            .values_list("pk")
+        )
+
+    def recipe_amounts(self, recipe_id: int) -> Dict[int, int]:
+        """
+        Snapshot the ingredient amounts of a recipe before it changes.
+
+        Args:
+            recipe_id (int): The recipe.
+
+        Returns:
+            Dict[int, int]: Total amount by ingredient id.
+        """
+
+        return dict(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id)
+            .order_by()
+            .values("ingredient_id")
+            .annotate(amount=models.Sum("amount"))
+            .values_list("ingredient_id", "amount")
+        )
+
+    def update_recipe(
+        self, recipe_id: int, old_amounts: Dict[int, int]
+    ) -> None:
+        """
+        Apply a change of a recipe's ingredients to every cart holding it.
+
+        Args:
+            recipe_id (int): The changed recipe.
+            old_amounts (Dict[int, int]):
+                The amounts returned by `recipe_amounts()` before the
+                change.
+        """
+
+        new_amounts = self.recipe_amounts(recipe_id)
+        deltas = {
+            ingredient_id: new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+            for ingredient_id in sorted(old_amounts.keys() | new_amounts)
+        }
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not deltas:
+            return
+        self._execute(
+            """
+            INSERT INTO {items} AS item (user_id, ingredient_id, total_amount)
+            SELECT cart.user_id, delta.ingredient_id, delta.amount
+            FROM {carts} AS cart
+            CROSS JOIN unnest(%s::bigint[], %s::integer[])
+                AS delta (ingredient_id, amount)
+            WHERE cart.recipe_id = %s
+            ORDER BY cart.user_id, delta.ingredient_id
+            ON CONFLICT (user_id, ingredient_id) DO UPDATE
+            SET total_amount = item.total_amount + EXCLUDED.total_amount
+            """,
+            [list(deltas), list(deltas.values()), recipe_id],
+        )
+        self._execute(
+            """
+            DELETE FROM {items}
+            WHERE total_amount <= 0
+            AND user_id IN (
+                SELECT user_id FROM {carts} WHERE recipe_id = %s
+            )
+            """,
+            [recipe_id],
+        )
+
+    def rebuild(self) -> None:
+        """
+        Recompute all shopping list totals from the shopping carts.
+
+        Must run inside a transaction; concurrent cart changes wait for
+        it to finish.
+        """
+
+        self._execute("LOCK TABLE {items} IN EXCLUSIVE MODE", [])
+        self._execute("DELETE FROM {items}", [])
+        self._execute(REBUILD_SHOPPING_LISTS, [])
+
+    def count_mismatches(self) -> int:
+        """
+        Compare the stored totals with totals computed from the carts.
+
+        Returns:
+            int: The number of (user, ingredient) pairs that differ.
+        """
+
+        return self._execute(
+            """
+            SELECT COUNT(*)
+            FROM {items} AS item
+            FULL OUTER JOIN ({expected}) AS expected
+                ON expected.user_id = item.user_id
+                AND expected.ingredient_id = item.ingredient_id
+            WHERE item.total_amount IS DISTINCT FROM expected.total_amount
+            """,
+            [],
+        )[0]
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="shopping_list"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name="shopping_lists"
+    )
+    total_amount = models.IntegerField(verbose_name="Total Amount")
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = "Shopping List Item"
+        verbose_name_plural = "Shopping List Items"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_user_ingredient"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.ingredient_id}: {self.total_amount}"
+
+
+FAN_OUT = """
+    INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date)
+    SELECT subscription.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {recipes} AS recipe
+    JOIN {users} AS author ON author.id = recipe.author_id
+    JOIN {subscriptions} AS subscription
+        ON subscription.author_id = recipe.author_id
+    WHERE author.followers_count <= %s AND {condition}
+    ORDER BY subscription.user_id, recipe.id
+    ON CONFLICT DO NOTHING
+"""
+
+FEED = """
+    (
+        SELECT pub_date, recipe_id FROM {timeline}
+        WHERE user_id = %(user)s {entries_before}
+        ORDER BY pub_date DESC, recipe_id DESC
+        LIMIT %(limit)s
+    )
+    UNION
+    (
+        SELECT recipe.pub_date, recipe.id
+        FROM {subscriptions} AS subscription
+        JOIN {users} AS author ON author.id = subscription.author_id
+        JOIN {recipes} AS recipe ON recipe.author_id = author.id
+        WHERE subscription.user_id = %(user)s
+        AND author.followers_count > %(celebrity_followers)s
+        {recipes_before}
+        ORDER BY recipe.pub_date DESC, recipe.id DESC
+        LIMIT %(limit)s
+    )
+    ORDER BY pub_date DESC, recipe_id DESC
+    LIMIT %(limit)s
+"""
+
+
+class TimelineEntryManager(models.Manager):
+    """
+    Maintains the per-user timelines of recipes from followed authors.
+
+    A new recipe is written to the timeline of every follower of its
+    author (fan-out on write), a subscription copies the author's
+    recipes into the subscriber's timeline and an unsubscription removes
+    them. Authors with more than `celebrity_followers` followers are not
+    fanned out: their recipes are read from the recipe table when the
+    feed is read. All changes are single statements relying on the
+    unique (user, pub_date, recipe) constraint, so repeating one is
+    harmless.
+
+    A recipe waiting for its fan-out is recorded by a `PendingFanOut`
+    row, written in the transaction creating the recipe and deleted in
+    the one fanning it out. Fan-outs lost with a worker restart or
+    failed ones are thus still pending, and `fan_out_pending()` retries
+    them.
+
+    Attributes:
+        celebrity_followers (int):
+            The largest number of followers an author is fanned out to.
+    """
+
+    celebrity_followers = 10000
+
+    def _execute(self, sql: str, params: Any, **parts: str) -> List[tuple]:
+        """
+        Run a statement with the table names and `parts` filled in.
+
+        Returns:
+            List[tuple]: The rows, if the statement returns rows.
+        """
+
+        parts.update(
+            timeline=self.model._meta.db_table,
+            recipes=Recipe._meta.db_table,
+            users=User._meta.db_table,
+            subscriptions=Subscription._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**parts), params)
+            if cursor.description is not None:
+                return cursor.fetchall()
+        return []
+
+    @transaction.atomic
+    def fan_out(self, recipe_id: int) -> bool:
+        """
+        Write a pending recipe to the timelines of its author's followers.
+
+        The pending row is deleted first, so a concurrent fan-out of the
+        same recipe waits for this one and then finds nothing to do.
+
+        Args:
+            recipe_id (int): The new recipe.
+
+        Returns:
+            bool: Whether the recipe was pending.
+        """
+
+        deleted, _ = PendingFanOut.objects.filter(recipe_id=recipe_id).delete()
+        if not deleted:
+            return False
+        self._execute(
+            FAN_OUT,
+            [self.celebrity_followers, recipe_id],
+            condition="recipe.id = %s",
+        )
+        return True
+
+    def fan_out_pending(self) -> int:
+        """
+        Fan out every recipe still pending, oldest first.
+
+        Returns:
+            int: The number of recipes fanned out.
+        """
+
+        return sum(
+            self.fan_out(recipe_id)
+            for recipe_id in PendingFanOut.objects.order_by(
+                "recipe_id"
+            ).values_list("recipe_id", flat=True)
+        )
+
+    def backfill(self, user_id: int, author_id: int) -> None:
+        """
+        Write the recipes of a newly followed author to a timeline.
+
+        Args:
+            user_id (int): The subscriber.
+            author_id (int): The followed author.
+        """
+
+        self._execute(
+            FAN_OUT,
+            [self.celebrity_followers, user_id, author_id],
+            condition=(
+                "subscription.user_id = %s AND subscription.author_id = %s"
+            ),
+        )
+
+    def prune(self, user_id: int, author_id: int) -> None:
+        """
+        Remove the recipes of an unfollowed author from a timeline.
+
+        Args:
+            user_id (int): The former subscriber.
+            author_id (int): The unfollowed author.
+        """
+
+        self.filter(user_id=user_id, author_id=author_id).delete()
+
+    def rebuild(self) -> None:
+        """
+        Recompute all timelines from the subscriptions.
+
+        Needed after `celebrity_followers` changes, or when an author
+        drops below it: recipes published while the author was pulled
+        on read are only written to timelines by a rebuild.
+
+        Must run inside a transaction.
+        """
+
+        self._execute("LOCK TABLE {timeline} IN EXCLUSIVE MODE", [])
+        self._execute("DELETE FROM {timeline}", [])
+        PendingFanOut.objects.all().delete()
+        self._execute(FAN_OUT, [self.celebrity_followers], condition="TRUE")
+
+    def feed(
+        self, user_id: int, limit: int,
+        before: Optional[Tuple[datetime, int]] = None
+    ) -> List[Tuple[datetime, int]]:
+        """
+        Read the newest recipes of the authors a user follows.
+
+        The timeline is read with one range scan of the unique index;
+        recipes of followed celebrity authors are merged in by the same
+        statement.
+
+        Args:
+            user_id (int): The reader.
+            limit (int): The largest number of recipes to return.
+            before (Tuple[datetime, int], optional):
+                Only return recipes published before this
+                `(pub_date, id)` key.
+
+        Returns:
+            List[Tuple[datetime, int]]:
+                The `(pub_date, id)` keys of the recipes, newest first.
+        """
+
+        params = {
+            "user": user_id,
+            "limit": limit,
+            "celebrity_followers": self.celebrity_followers,
+        }
+        entries_before = recipes_before = ""
+        if before is not None:
+            params["pub_date"], params["id"] = before
+            entries_before = (
+                "AND (pub_date, recipe_id) < (%(pub_date)s, %(id)s)"
+            )
+            recipes_before = (
+                "AND (recipe.pub_date, recipe.id) < (%(pub_date)s, %(id)s)"
+            )
+        return self._execute(
+            FEED, params,
+            entries_before=entries_before, recipes_before=recipes_before,
+        )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline",
+        db_index=False, verbose_name="Reader"
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="timeline_entries",
+        verbose_name="Recipe"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+",
+        db_index=False, verbose_name="Author"
+    )
+    pub_date = models.DateTimeField(verbose_name="Publication Date")
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        verbose_name = "Timeline Entry"
+        verbose_name_plural = "Timeline Entries"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "pub_date", "recipe"],
+                name="timeline_entry_unique",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.recipe_id}"
+
+
+class PendingFanOut(models.Model):
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name="+", verbose_name="Recipe"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name="Created At"
+    )
+
+    class Meta:
+        verbose_name = "Pending Fan-Out"
+        verbose_name_plural = "Pending Fan-Outs"
+
+    def __str__(self):
+        return str(self.recipe_id)
@@ -0,0 +1,172 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.images import generate_derivatives
+from recipes.models import (PendingFanOut, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, TimelineEntry)
+from users.models import Subscription
+
+logger = logging.getLogger(__name__)
+
+fan_out_pool = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="timeline-fan-out"
+)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(
+    sender, instance: ShoppingCart, created: bool, **kwargs
+) -> None:
+    """
+    Add the ingredients of a recipe put into the cart to the totals.
+    """
+
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(
+    sender, instance: ShoppingCart, **kwargs
+) -> None:
+    """
+    Subtract the ingredients of a recipe taken out of the cart.
+
+    Runs before any row of the deletion is removed, so the recipe
+    ingredients are still there when a whole recipe is deleted. The cart
+    row is locked first so that concurrent deletions of the same row
+    subtract only once.
+    """
+
+    if ShoppingCart.objects.select_for_update().filter(
+        pk=instance.pk
+    ).exists():
+        ShoppingListItem.objects.remove_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+def clear_tag_bit(sender, instance: Tag, **kwargs) -> None:
+    """
+    Clear the bit of a deleted tag from the masks of its recipes, so that
+    a tag given the bit later does not inherit them.
+
+    Runs before the tag assignments cascade away.
+    """
+
+    if instance.bit is not None:
+        Recipe.objects.filter(recipe_tags__tag=instance).update(
+            tags_mask=F("tags_mask").bitand(~(1 << instance.bit))
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_derivatives(
+    sender, instance: Recipe, raw: bool = False, **kwargs
+) -> None:
+    """
+    Generate the WebP derivatives of a newly uploaded recipe image.
+
+    Derivatives are recorded in `image_derivatives`. A recipe saved
+    with the same image keeps its derivatives. Images that cannot be
+    processed are logged, and the original keeps being served.
+    """
+
+    if raw or not instance.image:
+        return
+    recorded = instance.image_derivatives or {}
+    if recorded.get("source") == instance.image.name:
+        return
+    try:
+        derivatives = generate_derivatives(instance.image.name)
+    except OSError:
+        logger.exception(
+            "Cannot create derivatives of %s", instance.image.name
+        )
+        return
+    instance.image_derivatives = {"source": instance.image.name, **derivatives}
+    Recipe.objects.filter(pk=instance.pk).update(
+        image_derivatives=instance.image_derivatives
+    )
+
+
+def fan_out(recipe_id: int) -> None:
+    """
+    Write a recipe to its author's followers' timelines, then every
+    other recipe still pending, in a thread of `fan_out_pool`.
+
+    Fan-outs lost with a restarted worker or failed ones are thereby
+    retried with the next recipe published, when a worker starts (see
+    `gunicorn.conf.py`) or by the `fan_out_timelines` command.
+    """
+
+    try:
+        TimelineEntry.objects.fan_out(recipe_id)
+        TimelineEntry.objects.fan_out_pending()
+    except Exception:
+        logger.exception("Cannot fan out recipe %s", recipe_id)
+    finally:
+        connection.close()
+
+
+def fan_out_pending() -> None:
+    """
+    Fan out the recipes left pending, in a thread of `fan_out_pool`.
+    """
+
+    try:
+        TimelineEntry.objects.fan_out_pending()
+    except Exception:
+        logger.exception("Cannot fan out pending recipes")
+    finally:
+        connection.close()
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(
+    sender, instance: Recipe, created: bool, raw: bool = False, **kwargs
+) -> None:
+    """
+    Fan a new recipe out to the timelines in the background once it is
+    committed, so that publishing does not wait for every follower.
+
+    The recipe is recorded as pending in the creating transaction, so
+    the fan-out is not lost if the worker stops before it runs.
+    """
+
+    if created and not raw:
+        recipe_id = instance.pk
+        PendingFanOut.objects.create(recipe_id=recipe_id)
+        transaction.on_commit(lambda: fan_out_pool.submit(fan_out, recipe_id))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_timeline(
+    sender, instance: Subscription, created: bool, raw: bool = False,
+    **kwargs
+) -> None:
+    """
+    Add the recipes of a newly followed author to the subscriber's
+    timeline.
+    """
+
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_timeline(sender, instance: Subscription, **kwargs) -> None:
+    """
+    Remove the recipes of an unfollowed author from the former
+    subscriber's timeline.
+    """
+
+    TimelineEntry.objects.prune(instance.user_id, instance.author_id)
@@ -0,0 +1,63 @@
+import os
+from hashlib import sha256
+from pathlib import PurePosixPath
+from typing import Optional
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files after the SHA-256 of their content.
+
+    A file saved as `recipes/<anything>.png` is stored as
+    `recipes/<h[:2]>/<sha256>.png`, so identical uploads share one file.
+    Saving content that already exists only refreshes the file's
+    modification time, which keeps it from being collected as an orphan
+    right after being reused (see `collect_orphan_media`).
+    """
+
+    def content_name(self, name: str, content: File) -> str:
+        """
+        Build the storage name of a file from its content.
+
+        Args:
+            name (str): The name the file would be saved under.
+            content (File): The file content.
+
+        Returns:
+            str: The content-addressed name.
+        """
+
+        digest = sha256()
+        if hasattr(content, "seek"):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, "seek"):
+            content.seek(0)
+        path = PurePosixPath(name)
+        digest = digest.hexdigest()
+        return str(
+            path.parent / digest[:2] / f"{digest}{path.suffix.lower()}"
+        )
+
+    def save(
+        self, name: Optional[str], content: File,
+        max_length: Optional[int] = None
+    ) -> str:
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+recipe_image_storage = ContentAddressedStorage()
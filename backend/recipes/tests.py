@@ -0,0 +1,326 @@
+import io
+import json
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, PendingFanOut, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, TimelineEntry)
+from users.models import Subscription
+
+User = get_user_model()
+
+THREADS = 8
+
+
+def run_concurrently(function, *args_list):
+    """
+    Call `function` with each argument tuple in its own thread, all
+    released at once, and return the results in order.
+
+    Every thread closes its database connection when done.
+    """
+
+    barrier = Barrier(len(args_list))
+
+    def call(args):
+        try:
+            barrier.wait()
+            return function(*args)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=len(args_list)) as executor:
+        return list(executor.map(call, args_list))
+
+
+def create_user(username: str) -> User:
+    """
+    Create a user named after `username`.
+    """
+
+    return User.objects.create_user(
+        email=f"{username}@example.com", username=username,
+        first_name=username, last_name=username, password="password-123",
+    )
+
+
+def create_recipe(author: User, ingredients, amount: int = 10) -> Recipe:
+    """
+    Create a recipe of `author` using each of `ingredients` once.
+    """
+
+    recipe = Recipe.objects.create(
+        author=author, name="Recipe", text="Text", cooking_time=10,
+        image="recipes/recipe.png",
+        image_derivatives={"source": "recipes/recipe.png"},
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+class RecipeListConcurrencyTest(TransactionTestCase):
+    """
+    Racing adds and removals of the same recipe on a user's favorites
+    or cart leave at most one row, counted once, with every change
+    reported to exactly one caller.
+    """
+
+    def setUp(self):
+        self.user = create_user("reader")
+        self.recipe = create_recipe(
+            self.user,
+            [Ingredient.objects.create(name="Salt", measurement_unit="g")],
+        )
+
+    def assert_added_once(self, model, counter_field: str) -> None:
+        results = run_concurrently(
+            model.objects.add,
+            *[(self.user.pk, self.recipe.pk)] * THREADS,
+        )
+        self.assertEqual([added for _, added in results].count(True), 1)
+        self.assertEqual(
+            model.objects.filter(user=self.user, recipe=self.recipe).count(),
+            1,
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter_field), 1)
+
+    def assert_removed_once(self, model, counter_field: str) -> None:
+        model.objects.add(self.user.pk, self.recipe.pk)
+        results = run_concurrently(
+            model.objects.remove,
+            *[(self.user.pk, self.recipe.pk)] * THREADS,
+        )
+        self.assertEqual(results.count((True, True)), 1)
+        self.assertEqual(results.count((True, False)), THREADS - 1)
+        self.assertFalse(
+            model.objects.filter(user=self.user, recipe=self.recipe).exists()
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter_field), 0)
+
+    def assert_consistent_toggles(self, model, counter_field: str) -> None:
+        def toggle(adding: bool) -> int:
+            changes = 0
+            for _ in range(10):
+                if adding:
+                    _, added = model.objects.add(
+                        self.user.pk, self.recipe.pk
+                    )
+                    changes += added
+                else:
+                    _, removed = model.objects.remove(
+                        self.user.pk, self.recipe.pk
+                    )
+                    changes -= removed
+            return changes
+
+        changes = run_concurrently(
+            toggle, *[(number % 2 == 0,) for number in range(THREADS)]
+        )
+        rows = model.objects.filter(
+            user=self.user, recipe=self.recipe
+        ).count()
+        self.assertIn(rows, (0, 1))
+        self.assertEqual(sum(changes), rows)
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter_field), rows)
+
+    def shopping_list(self) -> list:
+        return list(
+            ShoppingListItem.objects.filter(user=self.user)
+            .values_list("total_amount", flat=True)
+        )
+
+    def test_favorite(self):
+        self.assert_added_once(Favorite, "favorites_count")
+
+    def test_shopping_cart(self):
+        self.assert_added_once(ShoppingCart, "in_carts_count")
+        self.assertEqual(self.shopping_list(), [10])
+
+    def test_favorite_removal(self):
+        self.assert_removed_once(Favorite, "favorites_count")
+
+    def test_shopping_cart_removal(self):
+        self.assert_removed_once(ShoppingCart, "in_carts_count")
+        self.assertEqual(self.shopping_list(), [])
+
+    def test_favorite_toggles(self):
+        self.assert_consistent_toggles(Favorite, "favorites_count")
+
+    def test_shopping_cart_toggles(self):
+        self.assert_consistent_toggles(ShoppingCart, "in_carts_count")
+        self.assertEqual(ShoppingListItem.objects.count_mismatches(), 0)
+
+
+class ShoppingListConcurrencyTest(TransactionTestCase):
+    """
+    The shopping list totals stay equal to the totals computed from the
+    carts while carts and recipe ingredients change concurrently.
+    """
+
+    def setUp(self):
+        self.author = create_user("author")
+        self.users = [create_user(f"reader{number}") for number in range(4)]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f"Ingredient {number}", measurement_unit="g"
+            )
+            for number in range(6)
+        ]
+        self.tag = Tag.objects.create(
+            name="breakfast", color="#E26C2D", slug="breakfast"
+        )
+        self.recipes = [
+            create_recipe(self.author, self.ingredients[:3])
+            for _ in range(3)
+        ]
+
+    def change_carts(self, user: User, seed: int) -> None:
+        generator = random.Random(seed)
+        for _ in range(40):
+            recipe = generator.choice(self.recipes)
+            if generator.random() < 0.6:
+                ShoppingCart.objects.add(user.pk, recipe.pk)
+            else:
+                ShoppingCart.objects.remove(user.pk, recipe.pk)
+
+    def change_ingredients(self, seed: int) -> None:
+        generator = random.Random(seed)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        for _ in range(15):
+            recipe = generator.choice(self.recipes)
+            ingredients = generator.sample(
+                self.ingredients, generator.randint(1, 5)
+            )
+            response = client.patch(
+                f"/api/recipes/{recipe.pk}/",
+                {
+                    "tags": [self.tag.pk],
+                    "ingredients": [
+                        {
+                            "id": ingredient.pk,
+                            "amount": generator.randint(1, 50),
+                        }
+                        for ingredient in ingredients
+                    ],
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200, response.data)
+
+    def test_concurrent_cart_and_ingredient_changes(self):
+        def work(kind: str, number: int) -> None:
+            if kind == "cart":
+                self.change_carts(self.users[number], number)
+            else:
+                self.change_ingredients(number)
+
+        run_concurrently(
+            work,
+            *[("cart", number) for number in range(len(self.users))],
+            *[("ingredients", number) for number in range(2)],
+        )
+        self.assertTrue(ShoppingListItem.objects.exists())
+        self.assertEqual(ShoppingListItem.objects.count_mismatches(), 0)
+
+
+class TimelineFanOutTest(TestCase):
+    """
+    A new recipe stays pending until it is fanned out, so a fan-out lost
+    before it ran is made up by `fan_out_pending()`.
+    """
+
+    def setUp(self):
+        self.author = create_user("author")
+        self.reader = create_user("reader")
+        Subscription.objects.create(user=self.reader, author=self.author)
+
+    def test_lost_fan_out_is_retried(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            recipe = create_recipe(self.author, [])
+        self.assertTrue(PendingFanOut.objects.filter(recipe=recipe).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(TimelineEntry.objects.fan_out_pending(), 1)
+        self.assertEqual(
+            list(
+                TimelineEntry.objects.values_list("user_id", "recipe_id")
+            ),
+            [(self.reader.pk, recipe.pk)],
+        )
+        self.assertFalse(PendingFanOut.objects.exists())
+        self.assertFalse(TimelineEntry.objects.fan_out(recipe.pk))
+
+
+class ImportCatalogueTest(TestCase):
+    """
+    `import_catalogue` upserts tags by slug and refuses imports that
+    would give two tags the same name or color.
+    """
+
+    def setUp(self):
+        Tag.objects.create(name="Breakfast", color="#E26C2D", slug="breakfast")
+
+    def import_tags(self, tags):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".json", encoding="utf-8"
+        ) as file:
+            json.dump(tags, file)
+            file.flush()
+            call_command(
+                "import_catalogue", file.name, model="tag", verbosity=0,
+                stdout=io.StringIO(),
+            )
+
+    def test_conflict_with_existing_tag(self):
+        with self.assertRaisesMessage(CommandError, "'Breakfast'"):
+            self.import_tags([
+                {"name": "Breakfast", "color": "#49B64E", "slug": "brunch"},
+            ])
+        self.assertFalse(Tag.objects.filter(slug="brunch").exists())
+
+    def test_conflict_within_file(self):
+        with self.assertRaisesMessage(CommandError, "lunch, supper"):
+            self.import_tags([
+                {"name": "Lunch", "color": "#8775D2", "slug": "lunch"},
+                {"name": "Supper", "color": "#8775D2", "slug": "supper"},
+            ])
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_value_freed_by_same_import(self):
+        with self.assertRaisesMessage(CommandError, "breakfast, morning"):
+            self.import_tags([
+                {"name": "Brunch", "color": "#E26C2D", "slug": "breakfast"},
+                {"name": "Breakfast", "color": "#49B64E", "slug": "morning"},
+            ])
+        self.assertEqual(Tag.objects.get(slug="breakfast").name, "Breakfast")
+
+    def test_update_by_slug(self):
+        self.import_tags([
+            {"name": "Brunch", "color": "#49B64E", "slug": "breakfast"},
+            {"name": "Lunch", "color": "#8775D2", "slug": "lunch"},
+        ])
+        self.assertEqual(
+            list(Tag.objects.order_by("slug").values_list(
+                "slug", "name", "color"
+            )),
+            [
+                ("breakfast", "Brunch", "#49B64E"),
+                ("lunch", "Lunch", "#8775D2"),
+            ],
+        )
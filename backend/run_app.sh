@@ -9,8 +9,9 @@ done;
 python manage.py makemigrations users;
 python manage.py makemigrations recipes;
 python manage.py migrate;
-python manage.py loaddata transformed_ingredients.json;
-python manage.py loaddata tag_fixtures.json;
+python manage.py import_catalogue transformed_ingredients.json;
+python manage.py import_catalogue tag_fixtures.json;
+python manage.py build_similarity_index --missing-only;
 python manage.py custom_createsuperuser;
 python manage.py collectstatic --noinput;
-gunicorn -w 2 -b 0:8000 foodgram_backend.wsgi;
+gunicorn -c gunicorn.conf.py -w 2 -b 0:8000 foodgram_backend.wsgi;
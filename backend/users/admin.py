@@ -2,13 +2,15 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
+from foodgram_api.admin import AutocompleteFilter, LargeTableAdminMixin
+
 from .models import Subscription
 
 User = get_user_model()
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     """
     Custom admin interface for User model.
 
@@ -17,9 +19,9 @@ class CustomUserAdmin(UserAdmin):
 
     list_display = [
         "email", "username", "first_name", "last_name",
-        "is_active", "date_joined",
+        "recipes_count", "followers_count", "is_active", "date_joined",
     ]
-    list_filter = ["is_active", "first_name", "email"]
+    list_filter = ["is_active", "is_staff", "date_joined"]
     search_fields = ["username", "email", "first_name", "last_name"]
     ordering = ["email"]
     fieldsets = (
@@ -48,7 +50,7 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Custom admin interface for Subscription model.
 
@@ -57,6 +59,11 @@ class SubscriptionAdmin(admin.ModelAdmin):
     """
 
     list_display = ["author", "user", "subscribed_at"]
-    list_filter = ["author", "user"]
+    list_select_related = ["author", "user"]
+    list_filter = [
+        AutocompleteFilter.for_field("author"),
+        AutocompleteFilter.for_field("user"),
+    ]
+    autocomplete_fields = ["author", "user"]
     readonly_fields = ["subscribed_at"]
     search_fields = ["author__username", "user__username"]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-17 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-subscribed_at', '-author'], name='subscription_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.6 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_subscription_user_date_idx'),
+        ('recipes', '0009_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Followers count'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Recipes count'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE users_customuser SET
+                recipes_count = (
+                    SELECT COUNT(*) FROM recipes_recipe
+                    WHERE author_id = users_customuser.id
+                ),
+                followers_count = (
+                    SELECT COUNT(*) FROM users_subscription
+                    WHERE author_id = users_customuser.id
+                )
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
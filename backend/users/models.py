@@ -27,6 +27,12 @@ class CustomUser(AbstractUser):
     )
     first_name = models.CharField("First name", max_length=150)
     last_name = models.CharField("Last name", max_length=150)
+    recipes_count = models.IntegerField(
+        "Recipes count", default=0, editable=False
+    )
+    followers_count = models.IntegerField(
+        "Followers count", default=0, editable=False
+    )
 
     class Meta:
         ordering = ["email"]
@@ -57,5 +63,11 @@ class Subscription(models.Model):
     class Meta:
         ordering = ["-id"]
         unique_together = ["user", "author"]
+        indexes = [
+            models.Index(
+                fields=["user", "-subscribed_at", "-author"],
+                name="subscription_user_date_idx",
+            ),
+        ]
         verbose_name = "Subscription"
         verbose_name_plural = "Subscriptions"
@@ -6,6 +6,7 @@ from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from foodgram_api.fields import RecipeImagesField
 from recipes.models import Recipe
 from users.models import Subscription
 from users.validators import validate_username
@@ -49,7 +50,8 @@ class CustomUserSerializer(UserSerializer):
     """
     Serializer for user information.
 
-    Inherits from UserSerializer of Djoser. Adds subscription status.
+    Inherits from UserSerializer of Djoser. Adds subscription status and
+    the stored recipe and follower counts.
 
     Methods:
         get_is_subscribed: Check if the user is subscribed to the object user.
@@ -61,7 +63,7 @@ class CustomUserSerializer(UserSerializer):
         model = User
         fields = (
             "email", "id", "username", "first_name",
-            "last_name", "is_subscribed"
+            "last_name", "is_subscribed", "recipes_count", "followers_count"
         )
 
     def get_is_subscribed(self, obj: User) -> bool:
@@ -77,6 +79,8 @@ class CustomUserSerializer(UserSerializer):
                 True if the current user is subscribed to obj, False otherwise.
         """
 
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
@@ -104,13 +108,16 @@ class SubscriptionRecipeSerializer(serializers.ModelSerializer):
 
     Attributes:
         image (Base64ImageField): Field for the recipe image in base64 format.
+        images (RecipeImagesField):
+            URLs of the image resized for small, card and full display.
     """
 
     image = Base64ImageField()
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -120,18 +127,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     Methods:
         get_is_subscribed: Check if the author is subscribed to the user.
         get_recipes: Get limited recipes of the author.
-        get_recipes_count: Get the count of recipes by the author.
     """
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = (
             "id", "email", "username", "first_name", "last_name",
-            "is_subscribed", "recipes", "recipes_count"
+            "is_subscribed", "recipes", "recipes_count", "followers_count"
         )
 
     def get_is_subscribed(self, obj: User) -> bool:
@@ -145,6 +150,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             bool: Subscription status.
         """
 
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         user = self.context["request"].user
         if user.is_anonymous:
             return False
@@ -163,29 +170,19 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             List[Dict]: A list of serialized recipes.
         """
 
-        limit = self.context["request"].query_params.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if limit is not None:
-            try:
-                limit = int(limit)
-                recipes = recipes[:limit]
-            except ValueError:
-                raise serializers.ValidationError(
-                    "Invalid recipes_limit value"
-                )
+        if hasattr(obj, "limited_recipes"):
+            recipes = obj.limited_recipes
+        else:
+            limit = self.context["request"].query_params.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if limit is not None:
+                try:
+                    limit = int(limit)
+                    recipes = recipes[:limit]
+                except ValueError:
+                    raise serializers.ValidationError(
+                        "Invalid recipes_limit value"
+                    )
         return SubscriptionRecipeSerializer(
             recipes, many=True, read_only=True
         ).data
-
-    def get_recipes_count(self, obj: User) -> int:
-        """
-        Get the count of recipes by the author.
-
-        Args:
-            obj (User): The user object being serialized.
-
-        Returns:
-            int: Number of recipes.
-        """
-
-        return obj.recipes.count()
@@ -1,6 +1,7 @@
 from typing import Optional
 
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef, Prefetch, QuerySet
 from django.http import HttpRequest
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -10,8 +11,11 @@ from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.request import Request
+from rest_framework.serializers import ValidationError
 
-from foodgram_api.pagination import CustomPageNumberPagination
+from foodgram_api.pagination import (CACHED, CustomPageNumberPagination,
+                                     KeysetPaginationMixin)
+from recipes.models import Recipe
 from users.models import Subscription
 from users.serializers import (CustomUserSerializer, PasswordSerializer,
                                SubscriptionSerializer)
@@ -19,7 +23,7 @@ from users.serializers import (CustomUserSerializer, PasswordSerializer,
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(KeysetPaginationMixin, UserViewSet):
     """
     Custom viewset for user operations including password setting,
     managing subscriptions, and listing subscriptions.
@@ -31,14 +35,57 @@ class CustomUserViewSet(UserViewSet):
         permission_classes (tuple): Permission classes for the viewset.
         serializer_class (CustomUserSerializer): Serializer for user data.
         pagination_class (CustomPageNumberPagination): Pagination class.
+        count_strategy (str): Page counts are cached until users or
+            subscriptions change.
     """
 
     queryset = User.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     serializer_class = CustomUserSerializer
     pagination_class = CustomPageNumberPagination
+    count_strategy = CACHED
     serializer_class = CustomUserSerializer
 
+    def get_subscription_queryset(self, request: Request) -> QuerySet:
+        """
+        Build the queryset of authors used for subscription responses.
+
+        `is_subscribed` is annotated and the latest recipes of every
+        author are prefetched into `limited_recipes` with a single
+        windowed query, honouring `recipes_limit`. The recipe count is
+        the author's stored `recipes_count`.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            QuerySet: The annotated queryset of users.
+
+        Raises:
+            ValidationError: If `recipes_limit` is not an integer.
+        """
+
+        recipes = Recipe.objects.only(
+            "id", "author_id", "name", "image", "image_derivatives",
+            "cooking_time", "pub_date"
+        )
+        limit = request.query_params.get("recipes_limit")
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise ValidationError("Invalid recipes_limit value")
+            recipes = recipes[:max(limit, 0)]
+        return User.objects.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=OuterRef("pk"), author=request.user
+                )
+            ),
+        ).prefetch_related(
+            Prefetch("recipes", queryset=recipes, to_attr="limited_recipes")
+        )
+
     @action(
         methods=['GET'],
         detail=False,
@@ -106,12 +153,16 @@ class CustomUserViewSet(UserViewSet):
     @action(
         methods=["GET"],
         detail=False,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        keyset_fields=("subscribed_at", "id"),
     )
     def subscriptions(self, request: HttpRequest) -> Response:
         """
         List subscriptions of the user.
 
+        With the `cursor` parameter the authors are paginated by keyset,
+        latest subscriptions first.
+
         Args:
             request (HttpRequest): The request object.
 
@@ -120,7 +171,9 @@ class CustomUserViewSet(UserViewSet):
         """
 
         user = request.user
-        queryset = User.objects.filter(authors__user=user)
+        queryset = self.get_subscription_queryset(request).filter(
+            authors__user=user
+        ).annotate(subscribed_at=F("authors__subscribed_at"))
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             pages, many=True, context={"request": request}
@@ -162,7 +215,8 @@ class CustomUserViewSet(UserViewSet):
 
         Subscription.objects.create(user=user, author=author)
         serializer = SubscriptionSerializer(
-            author, context={"request": request}
+            self.get_subscription_queryset(request).get(pk=author.pk),
+            context={"request": request}
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 